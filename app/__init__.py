@@ -1,30 +1,110 @@
 import os
+import re
+import sys
 import logging
-from flask import Flask, request, make_response
+from functools import lru_cache
+from flask import Flask, Response, g, request, make_response
 from flask_socketio import SocketIO
+from werkzeug.exceptions import HTTPException
 # from flask_cors import CORS  # Commented out - using manual CORS handling
-from app.config import config
+from app.config import config, Config, DEV_SECRET_KEY
 
-# Configure logging
+# Configure logging - level comes from LOG_LEVEL (default INFO)
 logging.basicConfig(
-    level=logging.INFO,
+    level=os.environ.get('LOG_LEVEL', 'INFO').upper(),
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
 
 # Get logger
 logger = logging.getLogger(__name__)
 
+# Log tags are plain ASCII unless LOG_EMOJI=1 (handy for local dev)
+LOG_EMOJI = os.environ.get('LOG_EMOJI') == '1'
+if LOG_EMOJI and hasattr(sys.stderr, 'reconfigure'):
+    # Avoid encode errors on consoles that are not UTF-8 by default
+    sys.stderr.reconfigure(encoding='utf-8')
+
+def _tag(emoji, text):
+    return emoji if LOG_EMOJI else f'[{text}]'
+
+T_START = _tag('🚀', 'startup')
+T_CONFIG = _tag('📋', 'config')
+T_CORS = _tag('🌐', 'cors')
+T_SOCKET = _tag('🔌', 'socketio')
+T_ROUTES = _tag('📚', 'routes')
+T_INIT = _tag('🧠', 'init')
+T_OK = _tag('✅', 'ok')
+T_WARN = _tag('⚠️', 'warn')
+T_ERROR = _tag('❌', 'error')
+T_REQUEST = _tag('📡', 'request')
+
 # Initialize extensions
 socketio = SocketIO()
 
+# Allowed CORS origins, built once from configuration plus our production frontends
+ALLOWED_ORIGINS = frozenset(Config.CORS_ORIGINS) | frozenset({
+    'https://skribly.netlify.app',
+    'https://skribly-frontend.onrender.com',
+})
+
+# ngrok tunnels and local dev servers are always allowed.
+# Uses google-re2 (linear-time DFA) when installed, stdlib re otherwise.
+try:
+    import re2 as _origin_re
+except ImportError:
+    _origin_re = re
+NGROK_RE = _origin_re.compile(r'(\.ngrok-free\.app|\.ngrok\.app|\.ngrok\.io)$|^http://(localhost|127\.0\.0\.1):\d+$')
+
+# Static CORS headers shared by every cross-origin response, added in one extend() call
+CORS_STATIC_HEADERS = (
+    ('Access-Control-Allow-Credentials', 'true'),
+    ('Vary', 'Origin'),
+    ('Access-Control-Allow-Headers', 'Content-Type,Authorization,X-Requested-With,X-Session-ID,ngrok-skip-browser-warning,User-Agent'),
+    ('Access-Control-Allow-Methods', 'GET,POST,PUT,DELETE,OPTIONS'),
+)
+
+# Health check bodies never change, serialize them once
+HEALTH_BODY = b'{"status":"healthy","service":"skribbl-clone-backend"}'
+API_HEALTH_BODY = b'{"status":"healthy","service":"skribbl-clone-backend","api":"working","cors_configured":true,"socket_available":true}'
+
+# Generic body for unhandled errors - details go to the log, not the client
+INTERNAL_ERROR_BODY = b'{"error":"An unexpected server error occurred","code":"INTERNAL_ERROR"}'
+
+def _origin_allowed(origin):
+    """Check an Origin header against the allow-list and the ngrok/localhost pattern"""
+    return origin in ALLOWED_ORIGINS or bool(NGROK_RE.search(origin))
+
+@lru_cache(maxsize=4)
+def _config_items(config_name):
+    """Collect a config class's settings once - same keys from_object() would copy"""
+    config_class = config[config_name]
+    return tuple((key, getattr(config_class, key)) for key in dir(config_class) if key.isupper())
+
 def create_app(config_name=None):
     if config_name is None:
-        config_name = os.environ.get('FLASK_ENV', 'development')
+        # Default to production unless we're bound to localhost
+        default_env = 'development' if Config.HOST in ('127.0.0.1', 'localhost') else 'production'
+        config_name = os.environ.get('FLASK_ENV') or default_env
     
-    logger.info(f"🚀 Starting Flask app with config: {config_name}")
+    logger.info(f"{T_START} Starting Flask app with config: {config_name}")
     
     app = Flask(__name__)
-    app.config.from_object(config[config_name])
+    app.config.update(_config_items(config_name))
+    
+    # Never run a non-debug deployment on the public development secret
+    if not app.debug and app.config['SECRET_KEY'] == DEV_SECRET_KEY:
+        raise RuntimeError("SECRET_KEY must be set when running without debug mode")
+    
+    # Signed cookie sessions - they survive a restart, so a socket can rebuild its lost
+    # user session from them. Read-only endpoints that never use the session skip it entirely.
+    from app.utils.sessions import SessionBypassInterface
+    app.session_interface = SessionBypassInterface()
+    
+    # Faster JSON responses when orjson is installed
+    from app.utils.serialization import (
+        OrjsonProvider, OrjsonSocketJSON, SetJSONProvider, StdlibSocketJSON, orjson
+    )
+    app.json = OrjsonProvider(app) if orjson is not None else SetJSONProvider(app)
     
     # Configure session settings for cross-origin requests
     # For SameSite=None to work, Secure must be True, but we're on HTTP localhost
@@ -34,47 +114,61 @@ def create_app(config_name=None):
     app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'  # More permissive for development
     app.config['SESSION_COOKIE_DOMAIN'] = None  # Allow subdomain sharing
     
-    logger.info(f"📋 App config loaded: SECRET_KEY={'set' if app.config.get('SECRET_KEY') else 'NOT SET'}")
-    logger.info(f"📋 Debug mode: {app.config.get('DEBUG', False)}")
-    logger.info(f"📋 Session cookie settings: secure={app.config['SESSION_COOKIE_SECURE']}, samesite={app.config['SESSION_COOKIE_SAMESITE']}")
+    logger.info(f"{T_CONFIG} App config loaded: SECRET_KEY={'set' if app.config.get('SECRET_KEY') else 'NOT SET'}")
+    logger.info(f"{T_CONFIG} Debug mode: {app.config.get('DEBUG', False)}")
+    logger.info(f"{T_CONFIG} Session cookie settings: secure={app.config['SESSION_COOKIE_SECURE']}, samesite={app.config['SESSION_COOKIE_SAMESITE']}")
     
     # Configure CORS to allow all origins with credentials
-    logger.info("🌐 Configuring CORS...")
+    logger.info(f"{T_CORS} Configuring CORS...")
     
     # Disable Flask-CORS and handle CORS manually for better control
     # CORS(app, resources={r"/*": {"origins": "*"}})
-    logger.info(f"✅ CORS will be handled manually in after_request")
+    logger.info(f"{T_OK} CORS will be handled manually in after_request")
     
     # Configure SocketIO to allow all origins with credentials
-    logger.info("🔌 Configuring SocketIO...")
+    logger.info(f"{T_SOCKET} Configuring SocketIO...")
     
-    # Retrieve allowed origins from application config (Config.CORS_ORIGINS)
-    socketio_allowed_origins = app.config.get('CORS_ORIGINS', [])
+    # Allowed origins from application config (Config.CORS_ORIGINS) plus our production domains
+    socketio_allowed_origins = list(ALLOWED_ORIGINS)
 
-    # Ensure our Netlify and Render production domains are included
-    if 'https://skribly.netlify.app' not in socketio_allowed_origins:
-        socketio_allowed_origins.append('https://skribly.netlify.app')
-    if 'https://skribly-frontend.onrender.com' not in socketio_allowed_origins:
-        socketio_allowed_origins.append('https://skribly-frontend.onrender.com')
+    logger.info(f"{T_SOCKET} Socket.IO allowed origins: {socketio_allowed_origins}")
 
-    logger.info(f"🔌 Socket.IO allowed origins: {socketio_allowed_origins}")
+    socketio_debug = bool(app.config.get('DEBUG', False))
+    if not socketio_debug:
+        # Keep per-packet library logging quiet even if LOG_LEVEL is lowered globally
+        logging.getLogger('engineio.server').setLevel(logging.WARNING)
+        logging.getLogger('socketio.server').setLevel(logging.WARNING)
 
+    socketio_serializer = app.config['SOCKETIO_SERIALIZER']
+    if socketio_serializer == 'msgpack':
+        try:
+            import msgpack  # noqa: F401
+        except ImportError:
+            logger.warning("%s SOCKETIO_SERIALIZER=msgpack but msgpack is not installed - using JSON", T_WARN)
+            socketio_serializer = 'default'
+    
     socketio.init_app(app, 
                      cors_allowed_origins=socketio_allowed_origins,  # Use list from config
                      cors_credentials=True,                          # Enable credentials
                      async_mode=app.config.get('SOCKETIO_ASYNC_MODE', 'threading'),
-                     logger=True,   # Enable logging for debugging
-                     engineio_logger=True,  # Enable engine.io logging
-                     ping_timeout=60,       # Optimize for ngrok
-                     ping_interval=25,      # Optimize for ngrok
-                     transports=['polling'],                # PythonAnywhere: WebSockets unsupported → polling only
+                     logger=socketio_debug,           # Per-event logging only in debug mode
+                     engineio_logger=socketio_debug,  # Engine.IO logs every poll - debug only
+                     ping_timeout=app.config['SOCKETIO_PING_TIMEOUT'],
+                     ping_interval=app.config['SOCKETIO_PING_INTERVAL'],
+                     transports=app.config['SOCKETIO_TRANSPORTS'],          # Polling only unless configured
                      manage_session=False,                  # Use Flask's session management
-                     allow_upgrades=False,                  # Disable upgrade attempts that trigger 500 errors
+                     allow_upgrades=app.config['SOCKETIO_ALLOW_UPGRADES'],  # Off by default - upgrades 500 on PythonAnywhere
+                     message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],    # None = single process
+                     serializer=socketio_serializer,          # 'default' = JSON through the json module below
+                     json=OrjsonSocketJSON if orjson is not None else StdlibSocketJSON,
                      cookie=None)           # Disable cookies for CORS compatibility
-    logger.info("✅ SocketIO configured successfully with explicit origins list")
+    logger.info(f"{T_OK} SocketIO configured successfully with explicit origins list")
     
     # Register blueprints
-    logger.info("📚 Registering blueprints...")
+    # Their routes pass provide_automatic_options=False: CORS preflights are answered in
+    # handle_preflight, so Flask's implicit per-rule OPTIONS handling is never needed.
+    # (Flask 3.0 has no app-wide PROVIDE_AUTOMATIC_OPTIONS setting.)
+    logger.info(f"{T_ROUTES} Registering blueprints...")
     from app.routes.auth import auth_bp
     from app.routes.rooms import rooms_bp
     from app.routes.game import game_bp
@@ -82,135 +176,118 @@ def create_app(config_name=None):
     app.register_blueprint(auth_bp, url_prefix='/api/auth')
     app.register_blueprint(rooms_bp, url_prefix='/api/rooms')
     app.register_blueprint(game_bp, url_prefix='/api/game')
-    logger.info("✅ Blueprints registered successfully")
+    logger.info(f"{T_OK} Blueprints registered successfully")
     
     # Register socket handlers
-    logger.info("🔌 Registering socket handlers...")
+    logger.info(f"{T_SOCKET} Registering socket handlers...")
     from app.socket_handlers import room_handlers, game_handlers, drawing_handlers
-    logger.info("✅ Socket handlers registered successfully")
+    logger.info(f"{T_OK} Socket handlers registered successfully")
     
     # Initialize services
-    logger.info("🧠 Initializing memory service...")
+    logger.info(f"{T_INIT} Initializing memory service...")
     from app.services.memory_service import memory_service
     memory_service.init_app(app)
-    logger.info("✅ Memory service initialized successfully")
+    logger.info(f"{T_OK} Memory service initialized successfully")
     
-    logger.info("📚 Initializing word service...")
+    logger.info(f"{T_INIT} Initializing word service...")
     from app.services.word_service import word_service
     word_service.init_app(app)
-    logger.info("✅ Word service initialized successfully")
+    logger.info(f"{T_OK} Word service initialized successfully")
     
-    logger.info("⏰ Initializing timer service...")
+    logger.info(f"{T_INIT} Initializing timer service...")
     from app.services.timer_service import timer_service
     timer_service.init_app(app)
-    logger.info("✅ Timer service initialized successfully")
+    logger.info(f"{T_OK} Timer service initialized successfully")
     
-    logger.info("🏓 Initializing self-ping service...")
+    logger.info(f"{T_INIT} Initializing self-ping service...")
     from app.services.selfping_service import selfping_service
     selfping_service.init_app(app)
-    logger.info("✅ Self-ping service initialized successfully")
+    logger.info(f"{T_OK} Self-ping service initialized successfully")
     
-    @app.route('/health')
+    @app.route('/health', provide_automatic_options=False)
     def health_check():
-        from flask import jsonify
-        response = jsonify({'status': 'healthy', 'service': 'skribbl-clone-backend'})
-        response.headers['Content-Type'] = 'application/json'
-        return response
+        return Response(HEALTH_BODY, mimetype='application/json')
     
-    @app.route('/api/health')
+    @app.route('/api/health', provide_automatic_options=False)
     def api_health_check():
-        from flask import jsonify
-        response = jsonify({
-            'status': 'healthy', 
-            'service': 'skribbl-clone-backend', 
-            'api': 'working',
-            'cors_configured': True,
-            'socket_available': True
-        })
-        response.headers['Content-Type'] = 'application/json'
-        return response
+        return Response(API_HEALTH_BODY, mimetype='application/json')
+    
+    # One handler for unexpected route errors instead of a try/except in every view
+    @app.errorhandler(Exception)
+    def handle_unexpected_error(e):
+        if isinstance(e, HTTPException):
+            return e
+        logger.error("Unhandled exception in %s %s: %s", request.method, request.path, e, exc_info=True)
+        return Response(INTERNAL_ERROR_BODY, 500, mimetype='application/json')
+    
+    # Preflights additionally let the browser cache the result so repeat requests skip the OPTIONS round-trip
+    preflight_max_age = str(app.config['CORS_MAX_AGE'])
     
     # Handle preflight OPTIONS requests
+    # Clients can avoid preflights entirely by sending simple requests: a text/plain JSON body
+    # and the session id via cookie instead of the X-Session-ID header.
+    # The advertised header list below is kept for clients that still send custom headers.
     @app.before_request
     def handle_preflight():
-        if request.method == "OPTIONS":
-            logger.info(f"🔄 Handling preflight request for {request.path}")
-            origin = request.headers.get('Origin')
-            
-            # Allowed origins sourced from configuration
-            allowed_origins = app.config.get('CORS_ORIGINS', [])
-            if 'https://skribly.netlify.app' not in allowed_origins:
-                allowed_origins.append('https://skribly.netlify.app')
-            if 'https://skribly-frontend.onrender.com' not in allowed_origins:
-                allowed_origins.append('https://skribly-frontend.onrender.com')
+        # Read the Origin once per request; after_request reuses it from g
+        origin = g.cors_origin = request.headers.get('Origin')
+        
+        # Only genuine CORS preflights carry Access-Control-Request-Method; plain OPTIONS fall through
+        if request.method == "OPTIONS" and request.headers.get('Access-Control-Request-Method'):
+            debug = logger.isEnabledFor(logging.DEBUG)
+            if debug:
+                logger.debug("%s Handling preflight request for %s", T_CORS, request.path)
             
-            response = make_response()
+            # 204 with no body and no Content-Type - nothing for Flask to encode
+            response = make_response('', 204)
+            response.headers.pop('Content-Type', None)
+            response.direct_passthrough = True
+            # Every preflight answer is cacheable, including the no-origin fallback below
+            response.headers['Access-Control-Max-Age'] = preflight_max_age
             
-            # Never use wildcard with credentials - always specify exact origin
-            if origin and (origin in allowed_origins or 
-                          '.ngrok-free.app' in origin or 
-                          '.ngrok.app' in origin or 
-                          '.ngrok.io' in origin or
-                          origin.startswith('http://localhost:') or 
-                          origin.startswith('http://127.0.0.1:')):
-                response.headers['Access-Control-Allow-Origin'] = origin
-                response.headers['Access-Control-Allow-Credentials'] = 'true'
-                logger.info(f"✅ Preflight origin allowed: {origin}")
-            elif origin:
-                response.headers['Access-Control-Allow-Origin'] = origin
-                response.headers['Access-Control-Allow-Credentials'] = 'true'
-                logger.info(f"⚠️ Preflight origin allowed (fallback): {origin}")
-            else:
+            if not origin:
                 # No origin - this shouldn't happen with modern browsers
-                logger.warning("❌ Preflight request without origin header")
+                logger.warning("%s Preflight request without origin header", T_ERROR)
                 return response
-                
-            response.headers['Vary'] = 'Origin'
-            response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Requested-With,X-Session-ID,ngrok-skip-browser-warning,User-Agent'
-            response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
-            response.headers['Access-Control-Max-Age'] = '3600'
-            logger.info(f"✅ Preflight request handled for origin: {origin}")
+            
+            # Never use wildcard with credentials - always specify exact origin.
+            # Unknown origins are reflected too (fallback), so the allow-list only affects logging.
+            response.headers['Access-Control-Allow-Origin'] = origin
+            response.headers.extend(CORS_STATIC_HEADERS)
+            if debug:
+                if _origin_allowed(origin):
+                    logger.debug("%s Preflight origin allowed: %s", T_OK, origin)
+                else:
+                    logger.debug("%s Preflight origin allowed (fallback): %s", T_WARN, origin)
+                logger.debug("%s Preflight request handled for origin: %s", T_OK, origin)
+            # Headers are complete - nothing left for after_request to add
+            g.cors_origin = None
             return response
 
     # Add comprehensive CORS headers for all responses
     @app.after_request
     def after_request(response):
-        logger.info(f"📡 {request.method} {request.path} -> {response.status_code}")
+        # Per-request logging is debug only - skip formatting entirely otherwise
+        debug = logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            logger.debug("%s %s %s -> %s", T_REQUEST, request.method, request.path, response.status_code)
         
-        # Get the origin of the request
-        origin = request.headers.get('Origin')
-        logger.info(f"🌐 Request origin: {origin}")
-        
-        # Allowed origins sourced from configuration
-        allowed_origins = app.config.get('CORS_ORIGINS', [])
-        if 'https://skribly.netlify.app' not in allowed_origins:
-            allowed_origins.append('https://skribly.netlify.app')
-        if 'https://skribly-frontend.onrender.com' not in allowed_origins:
-            allowed_origins.append('https://skribly-frontend.onrender.com')
-        
-        # Set CORS headers - never use wildcard with credentials
-        if origin and (origin in allowed_origins or 
-                      '.ngrok-free.app' in origin or 
-                      '.ngrok.app' in origin or 
-                      '.ngrok.io' in origin or
-                      origin.startswith('http://localhost:') or 
-                      origin.startswith('http://127.0.0.1:')):
-            response.headers['Access-Control-Allow-Origin'] = origin
-            logger.info(f"✅ CORS origin allowed: {origin}")
-        elif origin:
-            response.headers['Access-Control-Allow-Origin'] = origin
-            logger.info(f"⚠️ CORS origin allowed (fallback): {origin}")
-        else:
-            # No origin header - don't set CORS headers
-            logger.info("ℹ️ No origin header, skipping CORS")
+        # Same-origin and server-to-server traffic (health monitors, self-ping) needs no CORS work
+        origin = g.get('cors_origin')
+        if not origin:
+            if debug:
+                logger.debug("%s No origin header, skipping CORS", T_CORS)
             return response
-            
-        response.headers['Access-Control-Allow-Credentials'] = 'true'
-        response.headers['Vary'] = 'Origin'
-        response.headers['Access-Control-Allow-Headers'] = 'Content-Type,Authorization,X-Requested-With,X-Session-ID,ngrok-skip-browser-warning,User-Agent'
-        response.headers['Access-Control-Allow-Methods'] = 'GET,POST,PUT,DELETE,OPTIONS'
         
-        logger.info(f"✅ CORS headers manually added for origin: {origin}")
+        # Set CORS headers - never use wildcard with credentials
+        response.headers['Access-Control-Allow-Origin'] = origin
+        response.headers.extend(CORS_STATIC_HEADERS)
+        if debug:
+            if _origin_allowed(origin):
+                logger.debug("%s CORS origin allowed: %s", T_OK, origin)
+            else:
+                logger.debug("%s CORS origin allowed (fallback): %s", T_WARN, origin)
+            logger.debug("%s CORS headers manually added for origin: %s", T_OK, origin)
         
         return response
     
@@ -2,15 +2,28 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv()
+# Parse .env once per process tree - workers and subprocesses inherit the loaded values
+if not os.environ.get('_DOTENV_LOADED'):
+    load_dotenv()
+    os.environ['_DOTENV_LOADED'] = '1'
+
+def _split_env(value):
+    """Split a comma-separated env value into a tuple of trimmed, non-empty items"""
+    return tuple(item.strip() for item in value.split(',') if item.strip())
+
+# Development-only fallback secret - refused in production
+DEV_SECRET_KEY = 'skribbl-clone-dev-secret-key-123456789'
 
 class Config:
     # Flask configuration
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'skribbl-clone-dev-secret-key-123456789'
+    SECRET_KEY = os.environ.get('SECRET_KEY') or DEV_SECRET_KEY
     
     # CORS configuration - include ngrok URLs by default
-    CORS_ORIGINS = os.environ.get('CORS_ORIGINS', 
-        'https://skribly.netlify.app,https://skribly-frontend.onrender.com,https://skribly-backend.onrender.com,https://immortal-allowed-bulldog.ngrok-free.app,https://heron-ruling-deadly.ngrok-free.app,http://localhost:3000,http://127.0.0.1:3000').split(',')
+    CORS_ORIGINS = _split_env(os.environ.get('CORS_ORIGINS', 
+        'https://skribly.netlify.app,https://skribly-frontend.onrender.com,https://skribly-backend.onrender.com,https://immortal-allowed-bulldog.ngrok-free.app,https://heron-ruling-deadly.ngrok-free.app,http://localhost:3000,http://127.0.0.1:3000'))
+    
+    # How long (seconds) browsers may cache a preflight response - 86400 is the Chromium cap
+    CORS_MAX_AGE = int(os.environ.get('CORS_MAX_AGE') or 86400)
     
     # Server configuration
     HOST = os.environ.get('HOST') or '127.0.0.1'
@@ -18,11 +31,37 @@ class Config:
     
     # Socket.IO configuration
     SOCKETIO_ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE') or 'threading'
+    # Polling only by default (PythonAnywhere has no WebSockets) - set to 'polling,websocket'
+    # and SOCKETIO_ALLOW_UPGRADES=true where WebSockets are available
+    SOCKETIO_TRANSPORTS = _split_env(os.environ.get('SOCKETIO_TRANSPORTS') or 'polling')
+    SOCKETIO_ALLOW_UPGRADES = (os.environ.get('SOCKETIO_ALLOW_UPGRADES') or 'false').lower() == 'true'
+    SOCKETIO_PING_TIMEOUT = int(os.environ.get('SOCKETIO_PING_TIMEOUT') or 60)
+    SOCKETIO_PING_INTERVAL = int(os.environ.get('SOCKETIO_PING_INTERVAL') or 25)
+    # 'msgpack' encodes every Socket.IO packet as MessagePack (pip install msgpack) - clients then
+    # need socket.io-msgpack-parser; 'default' keeps JSON
+    SOCKETIO_SERIALIZER = os.environ.get('SOCKETIO_SERIALIZER') or 'default'
+    # Optional Redis URL so several workers can fan out Socket.IO emits
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('REDIS_URL') or None
     
     # Game configuration
     WORD_SELECTION_TIME = int(os.environ.get('WORD_SELECTION_TIME') or 10)
     DRAWING_TIME = int(os.environ.get('DRAWING_TIME') or 80)
     RESULT_DISPLAY_TIME = int(os.environ.get('RESULT_DISPLAY_TIME') or 5)
+    # Seconds between timer_update emits - raise (e.g. 10) when clients render a local countdown
+    TIMER_UPDATE_INTERVAL = int(os.environ.get('TIMER_UPDATE_INTERVAL') or 1)
+    # Seconds between draw_batch flushes (e.g. 0.02) - 0 sends every draw_move as its own draw_data
+    DRAW_BATCH_INTERVAL = float(os.environ.get('DRAW_BATCH_INTERVAL') or 0)
+    # Send batches as MessagePack draw_batch_bin frames instead of JSON draw_batch (pip install msgpack)
+    DRAW_BATCH_BINARY = (os.environ.get('DRAW_BATCH_BINARY') or 'false').lower() == 'true'
+    # Max draw_move events per second per socket - the excess is dropped, 0 disables the cap
+    DRAW_MOVE_RATE = int(os.environ.get('DRAW_MOVE_RATE') or 120)
+    # Round stroke coordinates and sizes to whole pixels - only for clients that send pixel coordinates
+    DRAW_INTEGER_COORDS = (os.environ.get('DRAW_INTEGER_COORDS') or 'false').lower() == 'true'
+    # Leave the full scores map out of correct_guess/turn_ended - clients add 'score' or read 'results' instead
+    COMPACT_SCORE_EVENTS = (os.environ.get('COMPACT_SCORE_EVENTS') or 'false').lower() == 'true'
+    # Seconds to coalesce join/leave room_updated snapshots (e.g. 0.05) - player_joined/player_left then carry
+    # only the changed player; 0 embeds the full room in each of them
+    ROOM_UPDATE_DEBOUNCE = float(os.environ.get('ROOM_UPDATE_DEBOUNCE') or 0)
 
 # Game Configuration Constants
 class GameConfig:
@@ -50,6 +89,7 @@ class DevelopmentConfig(Config):
 class ProductionConfig(Config):
     DEBUG = False
     FLASK_ENV = 'production'
+    TEMPLATES_AUTO_RELOAD = False  # No template stat() checks per render
 
 config = {
     'development': DevelopmentConfig,
@@ -1,212 +1,167 @@
 import uuid
 import logging
-from datetime import datetime
-from flask import Blueprint, request, jsonify, session, make_response
+from flask import Blueprint, request, jsonify, session
 from app.services.memory_service import memory_service
+from app.utils.auth import resolve_session_id, resolve_user
+from app.utils.responses import static_json
+from app.utils.timestamps import iso_now
 
 # Configure logger
 logger = logging.getLogger(__name__)
 
 auth_bp = Blueprint('auth', __name__)
 
-@auth_bp.route('/session', methods=['POST'])
+# Constant error responses, serialized once
+_ERR_USERNAME_REQUIRED = static_json({'error': 'Username is required'}, 400)
+_ERR_NO_SESSION = static_json({'error': 'No active session'}, 401)
+_ERR_SESSION_NOT_FOUND = static_json({'error': 'Session not found'}, 404)
+_INVALID_BODY_REQUIRED = static_json({'valid': False, 'error': 'Request body is required'}, 400)
+_INVALID_USERNAME_REQUIRED = static_json({'valid': False, 'error': 'Username is required'}, 400)
+_INVALID_USERNAME_LENGTH = static_json({'valid': False, 'error': 'Username must be 3-20 characters'}, 400)
+_INVALID_USERNAME_TAKEN = static_json({'valid': False, 'error': 'Username is already taken'}, 400)
+_VALID = static_json({'valid': True}, 200)
+
+@auth_bp.route('/session', methods=['POST'], provide_automatic_options=False)
 def create_session():
     """Create a new user session"""
-    logger.info("=== CREATE SESSION REQUEST ===")
-    try:
-        # Log request details
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"Request content type: {request.content_type}")
-        
-        data = request.get_json()
-        logger.info(f"Request data: {data}")
-        
-        username = data.get('username', '').strip() if data else ''
-        logger.info(f"Extracted username: '{username}'")
-        
-        if not username:
-            logger.warning("Username validation failed: empty username")
-            return jsonify({'error': 'Username is required'}), 400
-        
-        # Generate unique session ID
-        session_id = str(uuid.uuid4())
-        logger.info(f"Generated session ID: {session_id}")
-        
-        # Create user session data
-        user_data = {
-            'session_id': session_id,
-            'username': username,
-            'avatar_url': data.get('avatar_url') if data else None,
-            'created_at': datetime.utcnow().isoformat(),
-            'current_room': None
-        }
-        logger.info(f"Created user data: {user_data}")
-        
-        # Store in memory service
-        logger.info("Attempting to store in memory service...")
-        memory_service.add_user_session(session_id, user_data)
-        logger.info("Successfully stored in memory service")
-        
-        # Set session cookie
-        logger.info("Setting session cookies...")
-        session['user_id'] = session_id
-        session['username'] = username
-        logger.info(f"Session cookies set. Current session: {dict(session)}")
-        
-        response_data = {
-            'success': True,
-            'session_id': session_id,
-            'user': user_data
-        }
-        logger.info(f"Returning response: {response_data}")
-        
-        # Create response and explicitly set session cookie
-        response = make_response(jsonify(response_data))
-        
-        # Set custom session cookie with cross-origin settings
-        origin = request.headers.get('Origin')
-        logger.info(f"Setting cookie for origin: {origin}")
-        
-        # For cross-origin requests, we can't use SameSite=None with Secure=False
-        # So we'll set a more permissive cookie
-        response.set_cookie(
-            'skribly_session_id',
-            session_id,
-            secure=False,  # Allow HTTP
-            httponly=False,  # Allow JS access
-            samesite='Lax',  # Best we can do for HTTP cross-origin
-            domain=None,  # Allow all domains
-            path='/'  # Available for all paths
-        )
-        
-        logger.info(f"Custom session cookie set: skribly_session_id={session_id}")
-        
-        return response, 201
-        
-    except Exception as e:
-        logger.error(f"Exception in create_session: {str(e)}", exc_info=True)
-        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+    logger.debug("=== CREATE SESSION REQUEST ===")
+    logger.debug("Request content type: %s, has session cookie: %s",
+                 request.content_type, 'skribly_session_id' in request.cookies)
+    
+    # force=True also accepts text/plain bodies, which browsers send without a preflight
+    data = request.get_json(force=True, silent=True)
+    logger.debug("Request data: %s", data)
+    
+    username = data.get('username', '').strip() if data else ''
+    logger.debug("Extracted username: '%s'", username)
+    
+    if not username:
+        logger.warning("Username validation failed: empty username")
+        return _ERR_USERNAME_REQUIRED()
+    
+    # Generate unique session ID
+    session_id = str(uuid.uuid4())
+    logger.debug("Generated session ID: %s", session_id)
+    
+    # Create user session data
+    user_data = {
+        'session_id': session_id,
+        'username': username,
+        'avatar_url': data.get('avatar_url') if data else None,
+        'created_at': iso_now(),
+        'current_room': None
+    }
+    logger.debug("Created user data: %s", user_data)
+    
+    # Store in memory service
+    logger.debug("Attempting to store in memory service...")
+    memory_service.add_user_session(session_id, user_data)
+    logger.debug("Successfully stored in memory service")
+    
+    # Signed session cookie - lets a socket rebuild this user session after a server restart
+    session['user_id'] = session_id
+    session['username'] = username
+    
+    response_data = {
+        'success': True,
+        'session_id': session_id,
+        'user': user_data
+    }
+    logger.debug("Returning response: %s", response_data)
+    
+    # Create response and set the session id cookie (jsonify already returns a Response)
+    response = jsonify(response_data)
+    
+    # Set custom session cookie with cross-origin settings
+    origin = request.headers.get('Origin')
+    logger.debug("Setting cookie for origin: %s", origin)
+    
+    # For cross-origin requests, we can't use SameSite=None with Secure=False
+    # So we'll set a more permissive cookie
+    response.set_cookie(
+        'skribly_session_id',
+        session_id,
+        secure=False,  # Allow HTTP
+        httponly=False,  # Allow JS access
+        samesite='Lax',  # Best we can do for HTTP cross-origin
+        domain=None,  # Allow all domains
+        path='/'  # Available for all paths
+    )
+    
+    logger.debug("Custom session cookie set: skribly_session_id=%s", session_id)
+    
+    return response, 201
 
-@auth_bp.route('/session', methods=['GET'])
+@auth_bp.route('/session', methods=['GET'], provide_automatic_options=False)
 def get_session():
     """Get current user session"""
-    logger.info("=== GET SESSION REQUEST ===")
-    try:
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"Request cookies: {dict(request.cookies)}")
-        logger.info(f"Session data: {dict(session)}")
-        
-        # Check if user is authenticated (try multiple methods)
-        session_id = session.get('user_id')
-        logger.info(f"User ID from Flask session: {session_id}")
-        
-        # If no session_id in Flask session, try custom cookie
-        if not session_id:
-            session_id = request.cookies.get('skribly_session_id')
-            logger.info(f"User ID from custom cookie: {session_id}")
-        
-        # If still no session_id, try custom header (for cross-origin compatibility)
-        if not session_id:
-            session_id = request.headers.get('X-Session-ID')
-            logger.info(f"User ID from custom header: {session_id}")
-        
-        if not session_id:
-            logger.warning("No session ID found in session, cookies, or headers")
-            return jsonify({'error': 'No active session'}), 401
-        
-        user_data = memory_service.get_user_session(session_id)
-        
-        if not user_data:
-            return jsonify({'error': 'Session not found'}), 404
-        
-        return jsonify({
-            'success': True,
-            'user': user_data
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    logger.debug("=== GET SESSION REQUEST ===")
+    # Check if user is authenticated (session, cookie, header, then query string)
+    session_id, user_data = resolve_user()
+    
+    if not session_id:
+        logger.warning("No session ID found in session, cookies, or headers")
+        return _ERR_NO_SESSION()
+    
+    if not user_data:
+        return _ERR_SESSION_NOT_FOUND()
+    
+    return jsonify({
+        'success': True,
+        'user': user_data
+    }), 200
 
-@auth_bp.route('/session', methods=['DELETE'])
+@auth_bp.route('/session', methods=['DELETE'], provide_automatic_options=False)
 def destroy_session():
     """Destroy user session"""
-    try:
-        session_id = session.get('user_id')
-        
-        if session_id:
-            memory_service.remove_user_session(session_id)
-        
-        # Clear session
-        session.clear()
-        
-        return jsonify({'success': True}), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    session_id = resolve_session_id()
+    
+    if session_id:
+        memory_service.remove_user_session(session_id)
+    
+    # Clear session
+    session.clear()
+    
+    response = jsonify({'success': True})
+    response.delete_cookie('skribly_session_id', path='/')
+    return response, 200
 
-@auth_bp.route('/validate', methods=['POST'])
+@auth_bp.route('/validate', methods=['POST'], provide_automatic_options=False)
 def validate_username():
     """Validate username availability"""
-    logger.info("=== VALIDATE USERNAME REQUEST ===")
-    try:
-        logger.info(f"Request method: {request.method}")
-        logger.info(f"Request content type: {request.content_type}")
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"Request origin: {request.headers.get('Origin')}")
-        
-        # Check if request has valid JSON data
-        if not request.is_json:
-            logger.warning("Request is not JSON")
-            return jsonify({'valid': False, 'error': 'Content-Type must be application/json'}), 400
-        
-        data = request.get_json()
-        logger.info(f"Request data: {data}")
-        
-        if not data:
-            logger.warning("Request data is None or empty")
-            return jsonify({'valid': False, 'error': 'Request body is required'}), 400
-        
-        username = data.get('username', '').strip() if data else ''
-        logger.info(f"Username to validate: '{username}'")
-        
-        if not username:
-            logger.warning("Username validation failed: empty")
-            return jsonify({'valid': False, 'error': 'Username is required'}), 400
-        
-        if len(username) < 3 or len(username) > 20:
-            logger.warning(f"Username validation failed: length {len(username)}")
-            return jsonify({'valid': False, 'error': 'Username must be 3-20 characters'}), 400
-        
-        # Check if username is already taken in active sessions
-        logger.info("Checking username availability...")
-        logger.info(f"Current user sessions: {list(memory_service.user_sessions.keys())}")
-        
-        for session_data in memory_service.user_sessions.values():
-            existing_username = session_data.get('username', '')
-            logger.info(f"Comparing '{username.lower()}' with '{existing_username.lower()}'")
-            if existing_username.lower() == username.lower():
-                logger.warning(f"Username '{username}' is already taken")
-                return jsonify({'valid': False, 'error': 'Username is already taken'}), 400
-        
-        logger.info(f"Username '{username}' is available")
-        return jsonify({'valid': True}), 200
-        
-    except Exception as e:
-        logger.error(f"Exception in validate_username: {str(e)}", exc_info=True)
-        return jsonify({'valid': False, 'error': f'Internal server error: {str(e)}'}), 500
+    # Parse the body as JSON regardless of Content-Type so text/plain (simple, preflight-free) requests work
+    data = request.get_json(force=True, silent=True)
+    if not data:
+        logger.warning("Request data is None or empty")
+        return _INVALID_BODY_REQUIRED()
+    
+    # Cheapest checks first - most rejections never get past here
+    username = (data.get('username') or '').strip()
+    length = len(username)
+    if not length:
+        logger.warning("Username validation failed: empty")
+        return _INVALID_USERNAME_REQUIRED()
+    
+    if length < 3 or length > 20:
+        logger.warning("Username validation failed: length %s", length)
+        return _INVALID_USERNAME_LENGTH()
+    
+    # Check if username is already taken in active sessions - the caller's own session doesn't count
+    if memory_service.is_username_taken(username, exclude_session_id=resolve_session_id()):
+        logger.warning("Username '%s' is already taken", username)
+        return _INVALID_USERNAME_TAKEN()
+    
+    logger.debug("Username '%s' is available", username)
+    return _VALID()
 
-@auth_bp.route('/socket-test', methods=['GET'])
+@auth_bp.route('/socket-test', methods=['GET'], provide_automatic_options=False)
 def socket_test():
     """Test Socket.IO availability"""
-    try:
-        from app import socketio
-        return jsonify({
-            'socketio_available': socketio is not None,
-            'status': 'Socket.IO is configured and available',
-            'endpoint': '/socket.io/',
-            'transports': ['polling', 'websocket'],
-            'session_active': session.get('user_id') is not None
-        }), 200
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+    from app import socketio
+    return jsonify({
+        'socketio_available': socketio is not None,
+        'status': 'Socket.IO is configured and available',
+        'endpoint': '/socket.io/',
+        'transports': ['polling', 'websocket'],
+        'session_active': (session.get('user_id') or request.cookies.get('skribly_session_id')) is not None
+    }), 200
\ No newline at end of file
@@ -1,46 +1,45 @@
-from flask import Blueprint, request, jsonify, session
+from flask import Blueprint, jsonify
 from app.services.memory_service import memory_service
+from app.utils.auth import resolve_session_id
+from app.utils.responses import static_json
 
 game_bp = Blueprint('game', __name__)
 
-@game_bp.route('/stats', methods=['GET'])
+# Constant error responses, serialized once
+_ERR_AUTH_REQUIRED = static_json({'error': 'Authentication required'}, 401)
+_ERR_ROOM_NOT_FOUND = static_json({'error': 'Room not found'}, 404)
+_ERR_NOT_IN_ROOM = static_json({'error': 'Not in this room'}, 403)
+
+@game_bp.route('/stats', methods=['GET'], provide_automatic_options=False)
 def get_game_stats():
     """Get overall game statistics"""
-    try:
-        return jsonify({
-            'success': True,
-            'stats': {
-                'active_rooms': memory_service.get_room_count(),
-                'active_players': memory_service.get_active_players_count(),
-                'server_status': 'healthy'
-            }
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    return jsonify({
+        'success': True,
+        'stats': {
+            'active_rooms': memory_service.get_room_count(),
+            'active_players': memory_service.get_active_players_count(),
+            'server_status': 'healthy'
+        }
+    }), 200
 
-@game_bp.route('/room/<room_id>/status', methods=['GET'])
+@game_bp.route('/room/<room_id>/status', methods=['GET'], provide_automatic_options=False)
 def get_room_status(room_id):
     """Get current room and game status"""
-    try:
-        # Check if user is authenticated
-        user_id = session.get('user_id')
-        if not user_id:
-            return jsonify({'error': 'Authentication required'}), 401
-        
-        room_data = memory_service.get_room(room_id)
-        if not room_data:
-            return jsonify({'error': 'Room not found'}), 404
-        
-        # Check if user is in the room
-        if user_id not in room_data['players']:
-            return jsonify({'error': 'Not in this room'}), 403
-        
-        return jsonify({
-            'success': True,
-            'room': room_data,
-            'game_state': room_data['game_state']
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+    # Check if user is authenticated (session, session id cookie, header, then query string)
+    user_id = resolve_session_id()
+    if not user_id:
+        return _ERR_AUTH_REQUIRED()
+    
+    room_data, is_member = memory_service.get_room_for_member(room_id, user_id)
+    if not room_data:
+        return _ERR_ROOM_NOT_FOUND()
+    
+    # Check if user is in the room
+    if not is_member:
+        return _ERR_NOT_IN_ROOM()
+    
+    return jsonify({
+        'success': True,
+        'room': memory_service.serialize_room(room_data),
+        'game_state': room_data['game_state']
+    }), 200
\ No newline at end of file
@@ -1,278 +1,251 @@
-import random
-import string
-from flask import Blueprint, request, jsonify, session
+import os
+import base64
+import logging
+from flask import Blueprint, request, jsonify, current_app
 from app.services.memory_service import memory_service
 from app import socketio
 from app.config import GameConfig
+from app.socket_handlers import room_handlers
+from app.utils.auth import resolve_user
+from app.utils.responses import static_json
 
 rooms_bp = Blueprint('rooms', __name__)
+logger = logging.getLogger(__name__)
+
+# Numeric room setting bounds with their pre-serialized error responses
+_SETTING_LIMITS = (
+    ('rounds', GameConfig.MIN_ROUNDS, GameConfig.MAX_ROUNDS, static_json(
+        {'error': f'Rounds must be between {GameConfig.MIN_ROUNDS} and {GameConfig.MAX_ROUNDS}'}, 400)),
+    ('draw_time', GameConfig.MIN_DRAW_TIME, GameConfig.MAX_DRAW_TIME, static_json(
+        {'error': f'Draw time must be between {GameConfig.MIN_DRAW_TIME} and {GameConfig.MAX_DRAW_TIME} seconds'}, 400)),
+    ('max_players', GameConfig.MIN_PLAYERS, GameConfig.MAX_PLAYERS, static_json(
+        {'error': f'Max players must be between {GameConfig.MIN_PLAYERS} and {GameConfig.MAX_PLAYERS}'}, 400)),
+)
+_WORD_DIFFICULTIES = frozenset(GameConfig.WORD_DIFFICULTIES)
+
+# Constant error responses, serialized once
+_ERR_AUTH_REQUIRED = static_json({'error': 'Authentication required. Please create a username first.'}, 401)
+_ERR_SESSION_EXPIRED = static_json({'error': 'Your session has expired. Please create a username again.'}, 401)
+_ERR_INVALID_SETTINGS = static_json({'error': 'Invalid setting values provided'}, 400)
+_ERR_INVALID_DIFFICULTY = static_json({'error': 'Invalid word difficulty'}, 400)
+_ERR_ROOM_NOT_FOUND = static_json({'error': 'Room not found'}, 404)
+_ERR_JOIN_AUTH_REQUIRED = static_json({
+    'error': 'Authentication required. Please create a username first.',
+    'code': 'NOT_AUTHENTICATED'
+}, 401)
+_ERR_JOIN_SESSION_EXPIRED = static_json({
+    'error': 'Your session has expired. Please create a username again.',
+    'code': 'SESSION_EXPIRED'
+}, 401)
+_ERR_GAME_IN_PROGRESS = static_json({
+    'error': 'This game is already in progress and cannot be joined.',
+    'code': 'GAME_IN_PROGRESS'
+}, 400)
+_ERR_JOIN_FAILED = static_json({
+    'error': 'Failed to join room due to an unexpected error',
+    'code': 'JOIN_FAILED'
+}, 500)
 
 def generate_room_id():
-    """Generate a random 6-character room ID"""
-    return ''.join(random.choices(string.ascii_uppercase + string.digits, k=6))
+    """Generate a random 6-character room ID (base32: A-Z and 2-7, no 0/O or 1/I mix-ups)"""
+    return base64.b32encode(os.urandom(4))[:6].decode('ascii')
 
-@rooms_bp.route('/create', methods=['POST'])
+@rooms_bp.route('/create', methods=['POST'], provide_automatic_options=False)
 def create_room():
     """Create a new game room"""
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info("=== CREATE ROOM REQUEST ===")
+    logger.debug("=== CREATE ROOM REQUEST ===")
     
-    try:
-        logger.info(f"Request headers: {dict(request.headers)}")
-        logger.info(f"Request origin: {request.headers.get('Origin')}")
-        logger.info(f"Request cookies: {dict(request.cookies)}")
-        logger.info(f"Session data: {dict(session)}")
-        logger.info(f"Session ID: {session.sid if hasattr(session, 'sid') else 'No SID'}")
-        
-        # Check if user is authenticated (try multiple methods)
-        user_id = session.get('user_id')
-        logger.info(f"User ID from Flask session: {user_id}")
-        
-        # If no user_id in Flask session, try custom cookie
-        if not user_id:
-            user_id = request.cookies.get('skribly_session_id')
-            logger.info(f"User ID from custom cookie: {user_id}")
-        
-        # If still no user_id, try custom header (for cross-origin compatibility)
-        if not user_id:
-            user_id = request.headers.get('X-Session-ID')
-            logger.info(f"User ID from custom header: {user_id}")
-        
-        if not user_id:
-            logger.warning("No user ID found in session, cookies, or headers - user not authenticated")
-            return jsonify({'error': 'Authentication required. Please create a username first.'}), 401
-        
-        user_data = memory_service.get_user_session(user_id)
-        logger.info(f"User data from memory: {user_data}")
-        
-        if not user_data:
-            logger.warning(f"No user data found for user ID {user_id} - session expired or invalid")
-            return jsonify({'error': 'Your session has expired. Please create a username again.'}), 401
-        
-        data = request.get_json() or {}
-        
-        # Generate unique room ID
+    # Check if user is authenticated (session, cookie, header, then query string)
+    user_id, user_data = resolve_user()
+    
+    if not user_id:
+        logger.warning("No user ID found in session, cookies, or headers - user not authenticated")
+        return _ERR_AUTH_REQUIRED()
+    
+    if not user_data:
+        logger.warning("No user data found for user ID %s - session expired or invalid", user_id)
+        return _ERR_SESSION_EXPIRED()
+    
+    # force=True also accepts text/plain bodies, which browsers send without a preflight
+    data = request.get_json(force=True, silent=True) or {}
+    
+    # Generate unique room ID
+    room_id = generate_room_id()
+    while memory_service.has_room(room_id):  # Ensure uniqueness - with 32^6 IDs this almost never loops
         room_id = generate_room_id()
-        while memory_service.get_room(room_id):  # Ensure uniqueness
-            room_id = generate_room_id()
-        
-        # Parse room settings with proper type conversion
-        try:
-            settings = {
-                'rounds': int(data.get('rounds', GameConfig.DEFAULT_ROUNDS)),
-                'draw_time': int(data.get('draw_time', GameConfig.DEFAULT_DRAW_TIME)),
-                'word_difficulty': data.get('word_difficulty', GameConfig.DEFAULT_WORD_DIFFICULTY),
-                'max_players': int(data.get('max_players', GameConfig.DEFAULT_MAX_PLAYERS))
-            }
-        except (ValueError, TypeError) as e:
-            logger.error(f"Invalid setting values: {e}")
-            return jsonify({'error': 'Invalid setting values provided'}), 400
-        
-        # Validate settings
-        if not (GameConfig.MIN_ROUNDS <= settings['rounds'] <= GameConfig.MAX_ROUNDS):
-            return jsonify({'error': f'Rounds must be between {GameConfig.MIN_ROUNDS} and {GameConfig.MAX_ROUNDS}'}), 400
-        
-        if not (GameConfig.MIN_DRAW_TIME <= settings['draw_time'] <= GameConfig.MAX_DRAW_TIME):
-            return jsonify({'error': f'Draw time must be between {GameConfig.MIN_DRAW_TIME} and {GameConfig.MAX_DRAW_TIME} seconds'}), 400
-        
-        if settings['word_difficulty'] not in GameConfig.WORD_DIFFICULTIES:
-            return jsonify({'error': 'Invalid word difficulty'}), 400
-        
-        if not (GameConfig.MIN_PLAYERS <= settings['max_players'] <= GameConfig.MAX_PLAYERS):
-            return jsonify({'error': f'Max players must be between {GameConfig.MIN_PLAYERS} and {GameConfig.MAX_PLAYERS}'}), 400
-        
-        # Create room
-        room_name = data.get('name', f"{user_data['username']}'s Room")
-        room_data = memory_service.create_room(
-            room_id=room_id,
-            host_id=user_id,
-            settings=settings,
-            name=room_name
-        )
-        
-        # Update user session
-        user_data['current_room'] = room_id
-        
-        return jsonify({
-            'success': True,
-            'room': room_data
-        }), 201
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    
+    # Parse room settings with proper type conversion
+    try:
+        settings = {
+            'rounds': int(data.get('rounds', GameConfig.DEFAULT_ROUNDS)),
+            'draw_time': int(data.get('draw_time', GameConfig.DEFAULT_DRAW_TIME)),
+            'word_difficulty': data.get('word_difficulty', GameConfig.DEFAULT_WORD_DIFFICULTY),
+            'max_players': int(data.get('max_players', GameConfig.DEFAULT_MAX_PLAYERS))
+        }
+    except (ValueError, TypeError) as e:
+        logger.error("Invalid setting values: %s", e)
+        return _ERR_INVALID_SETTINGS()
+    
+    # Validate settings
+    for key, low, high, error_response in _SETTING_LIMITS:
+        if not (low <= settings[key] <= high):
+            return error_response()
+    
+    if settings['word_difficulty'] not in _WORD_DIFFICULTIES:
+        return _ERR_INVALID_DIFFICULTY()
+    
+    # Create room
+    room_name = data.get('name', f"{user_data['username']}'s Room")
+    room_data = memory_service.create_room(
+        room_id=room_id,
+        host_id=user_id,
+        settings=settings,
+        name=room_name
+    )
+    
+    # Update user session
+    user_data['current_room'] = room_id
+    
+    return jsonify({
+        'success': True,
+        'room': memory_service.serialize_room(room_data)
+    }), 201
 
-@rooms_bp.route('/<room_id>', methods=['GET'])
+@rooms_bp.route('/<room_id>', methods=['GET'], provide_automatic_options=False)
 def get_room(room_id):
     """Get room information"""
-    try:
-        room_data = memory_service.get_room_with_player_details(room_id)
-        
-        if not room_data:
-            return jsonify({'error': 'Room not found'}), 404
-        
-        return jsonify({
-            'success': True,
-            'room': room_data
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500
+    room_data = memory_service.get_room_with_player_details(room_id)
+    
+    if not room_data:
+        return _ERR_ROOM_NOT_FOUND()
+    
+    return jsonify({
+        'success': True,
+        'room': room_data
+    }), 200
 
-@rooms_bp.route('/<room_id>/join', methods=['POST'])
+@rooms_bp.route('/<room_id>/join', methods=['POST'], provide_automatic_options=False)
 def join_room(room_id):
     """Join an existing room"""
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"=== JOIN ROOM REQUEST: {room_id} ===")
+    logger.debug("=== JOIN ROOM REQUEST: %s ===", room_id)
     
-    try:
-        # Check if user is authenticated (try multiple methods)
-        user_id = session.get('user_id')
-        logger.info(f"User ID from Flask session: {user_id}")
-        
-        # If no user_id in Flask session, try custom cookie
-        if not user_id:
-            user_id = request.cookies.get('skribly_session_id')
-            logger.info(f"User ID from custom cookie: {user_id}")
-        
-        # If still no user_id, try custom header (for cross-origin compatibility)
-        if not user_id:
-            user_id = request.headers.get('X-Session-ID')
-            logger.info(f"User ID from custom header: {user_id}")
-        
-        logger.info(f"Full session data: {dict(session)}")
-        
-        if not user_id:
-            logger.warning("No user ID found in session, cookies, or headers - user not authenticated")
-            return jsonify({
-                'error': 'Authentication required. Please create a username first.',
-                'code': 'NOT_AUTHENTICATED'
-            }), 401
-        
-        user_data = memory_service.get_user_session(user_id)
-        logger.info(f"User data from memory: {user_data}")
-        
-        if not user_data:
-            logger.warning(f"No user data found for user ID {user_id} - session expired or invalid")
-            return jsonify({
-                'error': 'Your session has expired. Please create a username again.',
-                'code': 'SESSION_EXPIRED'
-            }), 401
-        
-        # Check if room exists
-        room_data = memory_service.get_room(room_id)
-        logger.info(f"Room data: {room_data}")
-        
-        if not room_data:
-            logger.warning(f"Room {room_id} not found")
-            return jsonify({
-                'error': f'Room {room_id} not found. It may have been deleted or expired.',
-                'code': 'ROOM_NOT_FOUND'
-            }), 404
-        
-        # Check if room is joinable
-        logger.info(f"Room status: {room_data['status']}")
-        if room_data['status'] != 'waiting':
-            logger.warning(f"Room status is {room_data['status']}, not waiting")
-            return jsonify({
-                'error': 'This game is already in progress and cannot be joined.',
-                'code': 'GAME_IN_PROGRESS'
-            }), 400
-        
-        # Check if user is already in the room
-        logger.info(f"Current players: {room_data['players']}")
-        logger.info(f"User {user_id} already in room: {user_id in room_data['players']}")
-        
-        if user_id in room_data['players']:
-            logger.info(f"User {user_id} already in room {room_id}, returning current room data")
-            # User is already in room (e.g., they're the host), just return the room data
-            return jsonify({
-                'success': True,
-                'room': room_data,
-                'message': 'You are already in this room'
-            }), 200
-        
-        # Check if room is full
-        if len(room_data['players']) >= room_data['max_players']:
-            logger.warning(f"Room {room_id} is full ({len(room_data['players'])}/{room_data['max_players']})")
-            return jsonify({
-                'error': f'Room is full ({len(room_data["players"])}/{room_data["max_players"]} players)',
-                'code': 'ROOM_FULL'
-            }), 400
+    # Check if user is authenticated (session, cookie, header, then query string)
+    user_id, user_data = resolve_user()
+    
+    if not user_id:
+        logger.warning("No user ID found in session, cookies, or headers - user not authenticated")
+        return _ERR_JOIN_AUTH_REQUIRED()
+    
+    if not user_data:
+        logger.warning("No user data found for user ID %s - session expired or invalid", user_id)
+        return _ERR_JOIN_SESSION_EXPIRED()
+    
+    # Check if room exists
+    room_data = memory_service.get_room(room_id)
+    logger.debug("Room data: %s", room_data)
+    
+    if not room_data:
+        logger.warning("Room %s not found", room_id)
+        return jsonify({
+            'error': f'Room {room_id} not found. It may have been deleted or expired.',
+            'code': 'ROOM_NOT_FOUND'
+        }), 404
+    
+    status = room_data['status']
+    players = room_data['players']
+    max_players = room_data['max_players']
+    
+    # Check if room is joinable
+    logger.debug("Room status: %s", status)
+    if status != 'waiting':
+        logger.warning("Room status is %s, not waiting", status)
+        return _ERR_GAME_IN_PROGRESS()
+    
+    # Check if user is already in the room
+    already_in_room = user_id in players
+    logger.debug("Current players: %s", players.keys())
+    logger.debug("User %s already in room: %s", user_id, already_in_room)
+    
+    if already_in_room:
+        logger.info("User %s already in room %s, returning current room data", user_id, room_id)
+        # User is already in room (e.g., they're the host), just return the room data
+        return jsonify({
+            'success': True,
+            'room': memory_service.serialize_room(room_data),
+            'message': 'You are already in this room'
+        }), 200
+    
+    # Check if room is full
+    n_players = len(players)
+    if n_players >= max_players:
+        logger.warning("Room %s is full (%s/%s)", room_id, n_players, max_players)
+        return jsonify({
+            'error': f'Room is full ({n_players}/{max_players} players)',
+            'code': 'ROOM_FULL'
+        }), 400
+    
+    # Try to add player
+    logger.debug("Attempting to add player %s (%s) to room %s", user_id, user_data['username'], room_id)
+    added, updated_room = memory_service.add_player_and_enrich(room_id, user_id)
+    if added:
+        # Update user session
+        user_data['current_room'] = room_id
+        logger.info("Successfully added player %s to room %s", user_data['username'], room_id)
+        logger.debug("Updated room has %s players", len(updated_room['players']))
         
-        # Try to add player
-        logger.info(f"Attempting to add player {user_id} ({user_data['username']}) to room {room_id}")
-        if memory_service.add_player_to_room(room_id, user_id):
-            # Update user session
-            user_data['current_room'] = room_id
-            logger.info(f"Successfully added player {user_data['username']} to room {room_id}")
-            
-            # Get updated room data with player details
-            updated_room = memory_service.get_room_with_player_details(room_id)
-            logger.info(f"Updated room has {len(updated_room['players'])} players")
-            
-            # Notify other players in the room via socket
+        debounce = current_app.config['ROOM_UPDATE_DEBOUNCE']
+        if debounce > 0:
+            # Delta now, full room in one room_updated for the whole burst - as the socket join does
             socketio.emit('player_joined', {
                 'player_id': user_id,
                 'username': user_data['username'],
-                'room': updated_room
+                'event': 'player_joined'
             }, room=room_id)
-            
-            # Also emit room_updated event for broader state sync
-            socketio.emit('room_updated', {
+            room_handlers.schedule_snapshot(room_id, debounce)
+        else:
+            # Notify other players in the room via socket. Both events carry the same
+            # payload (a superset of what each handler reads), so it is built once.
+            join_payload = {
+                'player_id': user_id,
+                'username': user_data['username'],
                 'room': updated_room,
-                'event': 'player_joined',
-                'player_id': user_id
-            }, room=room_id)
-            
-            logger.info(f"Emitted socket events for player {user_data['username']} joining room {room_id}")
+                'event': 'player_joined'
+            }
+            socketio.emit('player_joined', join_payload, room=room_id)
             
-            return jsonify({
-                'success': True,
-                'room': updated_room,
-                'message': f'Successfully joined {updated_room.get("name", "room")}'
-            }), 200
-        else:
-            logger.error(f"Failed to add player to room - unexpected error")
-            return jsonify({
-                'error': 'Failed to join room due to an unexpected error',
-                'code': 'JOIN_FAILED'
-            }), 500
-        
-    except Exception as e:
-        logger.error(f"Exception in join_room: {str(e)}", exc_info=True)
-        return jsonify({
-            'error': 'An unexpected server error occurred',
-            'code': 'INTERNAL_ERROR'
-        }), 500
-
-@rooms_bp.route('/list', methods=['GET'])
-def list_rooms():
-    """List all active rooms"""
-    try:
-        all_rooms = memory_service.get_all_rooms()
+            # Also emit room_updated event for broader state sync
+            socketio.emit('room_updated', join_payload, room=room_id)
         
-        # Filter out sensitive information and only show waiting rooms
-        public_rooms = []
-        for room in all_rooms:
-            if room['status'] == 'waiting':
-                host_session = memory_service.get_user_session(room['host'])
-                public_rooms.append({
-                    'id': room['id'],
-                    'name': room.get('name', 'Unnamed Room'),
-                    'players': len(room['players']),
-                    'max_players': room['max_players'],
-                    'status': room['status'],
-                    'host': host_session['username'] if host_session else 'Unknown'
-                })
+        logger.debug("Emitted socket events for player %s joining room %s", user_data['username'], room_id)
         
         return jsonify({
             'success': True,
-            'rooms': public_rooms,
-            'total_rooms': memory_service.get_room_count(),
-            'total_players': memory_service.get_active_players_count()
+            'room': updated_room,
+            'message': f'Successfully joined {updated_room.get("name", "room")}'
         }), 200
-        
-    except Exception as e:
-        return jsonify({'error': str(e)}), 500 
\ No newline at end of file
+    else:
+        logger.error("Failed to add player to room - unexpected error")
+        return _ERR_JOIN_FAILED()
+
+@rooms_bp.route('/list', methods=['GET'], provide_automatic_options=False)
+def list_rooms():
+    """List all active rooms"""
+    waiting_rooms = memory_service.get_waiting_rooms()
+    host_names = memory_service.usernames
+    
+    # Filter out sensitive information
+    public_rooms = [{
+        'id': room['id'],
+        'name': room.get('name', 'Unnamed Room'),
+        'players': len(room['players']),
+        'max_players': room['max_players'],
+        'status': 'waiting',
+        'host': host_names.get(room['host'], 'Unknown')
+    } for room in waiting_rooms]
+    
+    return jsonify({
+        'success': True,
+        'rooms': public_rooms,
+        'total_rooms': memory_service.get_room_count(),
+        'total_players': memory_service.get_active_players_count()
+    }), 200
\ No newline at end of file
@@ -1,72 +1,189 @@
+import heapq
+import itertools
+import logging
 import threading
-from datetime import datetime
+import time
 from app.config import GameConfig
+from app.utils.timestamps import iso_now
+
+logger = logging.getLogger(__name__)
+
+ROOM_LOCK_STRIPES = 32
+ROOM_MAX_AGE = 86400  # 24 hours
+
+# Prototypes cloned with dict.copy() per room; mutable members are replaced on each clone
+_DEFAULT_SETTINGS = {
+    'rounds': GameConfig.DEFAULT_ROUNDS,
+    'draw_time': GameConfig.DEFAULT_DRAW_TIME,
+    'word_difficulty': GameConfig.DEFAULT_WORD_DIFFICULTY,
+    'max_players': GameConfig.DEFAULT_MAX_PLAYERS
+}
+_GAME_STATE_PROTOTYPE = {
+    'current_round': 0,
+    'current_drawer': None,
+    'current_word': None,
+    'current_word_lower': None,
+    'scores': None,
+    'turn_start_time': None,
+    'words_used': None
+}
 
 class MemoryService:
     def __init__(self):
         self.active_rooms = {}
+        self.waiting_rooms = set()  # ids of rooms in 'waiting' status (listed publicly)
         self.user_sessions = {}
+        self.username_index = {}  # lowercased username -> set of session_ids using it
+        self.usernames = {}  # session_id -> display username, kept in step with user_sessions
         self.room_timers = {}
+        # Enriched room views, rebuilt only after the room or the session set changes
+        self._room_versions = {}  # room_id -> bumped on every room mutation
+        self._sessions_version = 0
+        self._enriched_cache = {}  # room_id -> ((room_version, sessions_version), enriched_room)
+        self._room_ids_counter = itertools.count(1)  # next() is atomic across lock stripes
+        self._room_ids_version = 0  # bumped on room create/delete
+        self._room_id_set = (-1, frozenset())  # (version, live room ids)
+        self._active_player_count = 0  # running total of players across all rooms
         self.app = None
-        self._lock = threading.Lock()
+        # Striped room locks - unrelated rooms don't contend. Reentrant so
+        # remove_player_from_room can delete the room it emptied.
+        self._room_locks = tuple(threading.RLock() for _ in range(ROOM_LOCK_STRIPES))
+        self._sessions_lock = threading.Lock()
+        self._count_lock = threading.Lock()
+        self._expiry_heap = []  # (expires_at, room_id, created_at_ts), soonest first
+        self._expiry_lock = threading.Lock()
+    
+    def _lock_for(self, room_id):
+        """Get the lock stripe guarding room_id"""
+        return self._room_locks[hash(room_id) % ROOM_LOCK_STRIPES]
+    
+    def _touch_room(self, room_id):
+        """Invalidate the cached enriched view of a room"""
+        self._room_versions[room_id] = self._room_versions.get(room_id, 0) + 1
+    
+    def _adjust_player_count(self, delta):
+        with self._count_lock:
+            self._active_player_count += delta
     
     def init_app(self, app):
         """Initialize the memory service with Flask app"""
         self.app = app
-        print("🧠 Memory service initialized - fully in-memory mode")
+        logger.info("🧠 Memory service initialized - fully in-memory mode")
     
     def create_room(self, room_id, host_id, settings=None, name=None):
         """Create a new room in memory"""
-        with self._lock:
+        with self._lock_for(room_id):
             if settings is None:
-                settings = {
-                    'rounds': GameConfig.DEFAULT_ROUNDS,
-                    'draw_time': GameConfig.DEFAULT_DRAW_TIME,
-                    'word_difficulty': GameConfig.DEFAULT_WORD_DIFFICULTY,
-                    'max_players': GameConfig.DEFAULT_MAX_PLAYERS
-                }
+                settings = _DEFAULT_SETTINGS.copy()
+            
+            game_state = _GAME_STATE_PROTOTYPE.copy()
+            game_state['scores'] = {host_id: 0}
+            game_state['words_used'] = []
             
             room_data = {
                 'id': room_id,
                 'host': host_id,
                 'name': name,
-                'players': [host_id],
+                'players': {host_id: None},  # insertion-ordered set of session ids
                 'max_players': settings['max_players'],
                 'status': 'waiting',
                 'settings': settings,
-                'game_state': {
-                    'current_round': 0,
-                    'current_drawer': None,
-                    'current_word': None,
-                    'scores': {host_id: 0},
-                    'turn_start_time': None,
-                    'words_used': []
-                },
-                'created_at': datetime.utcnow().isoformat()
+                'game_state': game_state,
+                'current_drawer': None,  # mirrors game_state['current_drawer'] for the drawing hot path
+                'created_at': iso_now(),
+                'created_at_ts': time.time()  # epoch seconds for cheap age checks
             }
             
             self.active_rooms[room_id] = room_data
-            print(f"🏠 Created room {room_id} with host {host_id}")
+            self._room_ids_version = next(self._room_ids_counter)
+            created_at_ts = room_data['created_at_ts']
+            with self._expiry_lock:
+                heapq.heappush(self._expiry_heap, (created_at_ts + ROOM_MAX_AGE, room_id, created_at_ts))
+            self.waiting_rooms.add(room_id)
+            self._adjust_player_count(1)
+            logger.debug("🏠 Created room %s with host %s", room_id, host_id)
             return room_data
     
     def get_room(self, room_id):
         """Get room data by ID"""
         return self.active_rooms.get(room_id)
     
+    def has_room(self, room_id):
+        """Check whether a room id is in use"""
+        return room_id in self.active_rooms
+    
+    def get_room_id_set(self):
+        """Get a frozenset of live room ids, rebuilt only after rooms are created or deleted"""
+        # Version is read before building, so a concurrent create/delete forces a rebuild next time
+        version = self._room_ids_version
+        cached_version, room_ids = self._room_id_set
+        if cached_version != version:
+            room_ids = frozenset(self.active_rooms)
+            self._room_id_set = (version, room_ids)
+        return room_ids
+    
+    def get_room_for_member(self, room_id, user_id):
+        """Get room data plus whether user_id is one of its players, in one lookup"""
+        room = self.active_rooms.get(room_id)
+        if room is None:
+            return None, False
+        return room, user_id in room['players']
+    
     def update_room(self, room_id, updates):
         """Update room data"""
-        with self._lock:
+        with self._lock_for(room_id):
             if room_id in self.active_rooms:
                 self.active_rooms[room_id].update(updates)
+                self._touch_room(room_id)
+                if 'status' in updates:
+                    self._index_room_status(room_id, updates['status'])
                 return self.active_rooms[room_id]
             return None
     
+    def record_correct_guess(self, room_id, user_id, points):
+        """Atomically award points and mark user_id as having guessed this turn.
+        Returns whether every non-drawer has now guessed, or None if user_id already had"""
+        with self._lock_for(room_id):
+            room = self.active_rooms.get(room_id)
+            if not room:
+                return None
+            game_state = room['game_state']
+            players_guessed = game_state['players_guessed']
+            if user_id in players_guessed:
+                return None
+            scores = game_state['scores']
+            scores[user_id] = scores.get(user_id, 0) + points
+            players_guessed.add(user_id)
+            self._touch_room(room_id)
+            return len(players_guessed) >= len(room['players']) - 1
+    
+    def set_room_status(self, room_id, status):
+        """Change a room's status and keep the waiting-rooms index in sync"""
+        with self._lock_for(room_id):
+            room = self.active_rooms.get(room_id)
+            if room:
+                room['status'] = status
+                self._touch_room(room_id)
+                self._index_room_status(room_id, status)
+            return room
+    
+    def _index_room_status(self, room_id, status):
+        if status == 'waiting':
+            self.waiting_rooms.add(room_id)
+        else:
+            self.waiting_rooms.discard(room_id)
+    
     def delete_room(self, room_id):
         """Delete room from memory"""
-        with self._lock:
+        with self._lock_for(room_id):
             if room_id in self.active_rooms:
-                print(f"🗑️ Deleting room {room_id}")
+                logger.debug("🗑️ Deleting room %s", room_id)
+                self._adjust_player_count(-len(self.active_rooms[room_id]['players']))
                 del self.active_rooms[room_id]
+                self._room_ids_version = next(self._room_ids_counter)
+            self.waiting_rooms.discard(room_id)
+            self._room_versions.pop(room_id, None)
+            self._enriched_cache.pop(room_id, None)
             if room_id in self.room_timers:
                 timer = self.room_timers[room_id]
                 if timer and timer.is_alive():
@@ -75,31 +192,43 @@ class MemoryService:
     
     def add_player_to_room(self, room_id, player_id):
         """Add a player to a room"""
-        with self._lock:
+        with self._lock_for(room_id):
             room = self.active_rooms.get(room_id)
             if room and player_id not in room['players']:
                 if len(room['players']) < room['max_players']:
-                    room['players'].append(player_id)
+                    room['players'][player_id] = None
+                    self._touch_room(room_id)
+                    self._adjust_player_count(1)
                     room['game_state']['scores'][player_id] = 0
-                    print(f"👤 Added player {player_id} to room {room_id}")
+                    logger.debug("👤 Added player %s to room %s", player_id, room_id)
                     return True
             return False
     
+    def add_player_and_enrich(self, room_id, player_id):
+        """Add a player and build the enriched room under the same lock - (added, enriched_room)"""
+        with self._lock_for(room_id):
+            if not self.add_player_to_room(room_id, player_id):
+                return False, None
+            return True, self._enrich_room(self.active_rooms[room_id])
+    
     def remove_player_from_room(self, room_id, player_id):
         """Remove a player from a room"""
-        with self._lock:
+        with self._lock_for(room_id):
             room = self.active_rooms.get(room_id)
             if room and player_id in room['players']:
-                room['players'].remove(player_id)
+                del room['players'][player_id]
+                self._adjust_player_count(-1)
                 if player_id in room['game_state']['scores']:
                     del room['game_state']['scores'][player_id]
                 
-                print(f"👋 Removed player {player_id} from room {room_id}")
+                logger.debug("👋 Removed player %s from room %s", player_id, room_id)
                 
                 # If host left, assign new host
                 if room['host'] == player_id and room['players']:
-                    room['host'] = room['players'][0]
-                    print(f"👑 New host for room {room_id}: {room['host']}")
+                    room['host'] = next(iter(room['players']))
+                    logger.debug("👑 New host for room %s: %s", room_id, room['host'])
+                
+                self._touch_room(room_id)
                 
                 # Delete room if empty
                 if not room['players']:
@@ -111,8 +240,47 @@ class MemoryService:
     
     def add_user_session(self, session_id, user_data):
         """Add user session data"""
+        with self._sessions_lock:
+            self._store_session(session_id, user_data)
+        logger.debug("🔐 Created session for %s", user_data.get('username', 'Anonymous'))
+    
+    def get_or_create_user_session(self, session_id, factory):
+        """Return (user_data, created) - factory() builds the session only if session_id has none yet"""
+        user_data = self.user_sessions.get(session_id)
+        if user_data is not None:
+            return user_data, False
+        with self._sessions_lock:
+            # Re-check under the lock - a concurrent caller may have created it first
+            user_data = self.user_sessions.get(session_id)
+            if user_data is not None:
+                return user_data, False
+            user_data = factory()
+            self._store_session(session_id, user_data)
+        logger.debug("🔐 Created session for %s", user_data.get('username', 'Anonymous'))
+        return user_data, True
+    
+    def _store_session(self, session_id, user_data):
+        """Insert a session and index it - caller holds _sessions_lock"""
+        previous = self.user_sessions.get(session_id)
+        if previous is not None:
+            # Re-stored under a new name - the old one is no longer this session's
+            self._unindex_username(previous.get('username'), session_id)
         self.user_sessions[session_id] = user_data
-        print(f"🔐 Created session for {user_data.get('username', 'Anonymous')}")
+        self.usernames[session_id] = user_data.get('username', 'Unknown')
+        self._sessions_version += 1
+        username = user_data.get('username')
+        if username:
+            self.username_index.setdefault(username.lower(), set()).add(session_id)
+    
+    def _unindex_username(self, username, session_id):
+        """Drop session_id from username's index entry - caller holds _sessions_lock"""
+        if not username:
+            return
+        owners = self.username_index.get(username.lower())
+        if owners is not None:
+            owners.discard(session_id)
+            if not owners:
+                del self.username_index[username.lower()]
     
     def get_user_session(self, session_id):
         """Get user session data"""
@@ -120,46 +288,62 @@ class MemoryService:
     
     def remove_user_session(self, session_id):
         """Remove user session data"""
-        if session_id in self.user_sessions:
-            user_data = self.user_sessions[session_id]
-            del self.user_sessions[session_id]
-            print(f"🚪 Removed session for {user_data.get('username', 'Anonymous')}")
+        with self._sessions_lock:
+            user_data = self.user_sessions.pop(session_id, None)
+            if user_data is None:
+                return
+            self.usernames.pop(session_id, None)
+            self._sessions_version += 1
+            self._unindex_username(user_data.get('username'), session_id)
+        logger.debug("🚪 Removed session for %s", user_data.get('username', 'Anonymous'))
+    
+    def is_username_taken(self, username, exclude_session_id=None):
+        """Check whether another active session already uses this username (case-insensitive)"""
+        owners = self.username_index.get(username.lower())
+        if not owners:
+            return False
+        return len(owners) > 1 or exclude_session_id not in owners
     
     def get_all_rooms(self):
         """Get all active rooms"""
         return list(self.active_rooms.values())
     
+    def get_waiting_rooms(self):
+        """Get rooms that are waiting for players, without scanning the rest"""
+        rooms = self.active_rooms
+        return [rooms[room_id] for room_id in tuple(self.waiting_rooms) if room_id in rooms]
+    
     def get_room_count(self):
         """Get total number of active rooms"""
         return len(self.active_rooms)
     
     def get_active_players_count(self):
         """Get total number of active players"""
-        total = 0
-        for room in self.active_rooms.values():
-            total += len(room['players'])
-        return total
+        return self._active_player_count
     
     def cleanup_inactive_rooms(self):
-        """Clean up empty or old rooms"""
-        with self._lock:
-            rooms_to_delete = []
-            for room_id, room_data in self.active_rooms.items():
-                # Delete empty rooms
-                if not room_data['players']:
-                    rooms_to_delete.append(room_id)
-                    continue
-                
-                # Delete very old rooms (over 24 hours)
-                created_at = datetime.fromisoformat(room_data['created_at'])
-                if (datetime.utcnow() - created_at).total_seconds() > 86400:  # 24 hours
+        """Clean up old rooms - empty rooms are already deleted when their last player leaves"""
+        # Pop only the deadlines that have passed instead of scanning every room
+        now = time.time()
+        heap = self._expiry_heap
+        rooms_to_delete = []
+        with self._expiry_lock:
+            while heap and heap[0][0] <= now:
+                _, room_id, created_at_ts = heapq.heappop(heap)
+                room = self.active_rooms.get(room_id)
+                # Skip entries for rooms already gone, or ids reused by a newer room
+                if room and room['created_at_ts'] == created_at_ts:
                     rooms_to_delete.append(room_id)
-            
-            for room_id in rooms_to_delete:
-                self.delete_room(room_id)
-            
-            if rooms_to_delete:
-                print(f"🧹 Cleaned up {len(rooms_to_delete)} inactive rooms")
+        
+        for room_id in rooms_to_delete:
+            self.delete_room(room_id)
+        
+        if rooms_to_delete:
+            logger.info("🧹 Cleaned up %s inactive rooms", len(rooms_to_delete))
+    
+    def serialize_room(self, room):
+        """Shallow copy of a room that is safe to send as JSON - players as a list of ids"""
+        return {**room, 'players': list(room['players'])}
     
     def get_room_with_player_details(self, room_id):
         """Get room data enriched with player details (usernames, etc)"""
@@ -167,20 +351,30 @@ class MemoryService:
         if not room:
             return None
         
-        # Create a copy of the room data with enriched player information
-        enriched_room = room.copy()
-        enriched_players = []
-        
-        for player_id in room['players']:
-            player_session = self.get_user_session(player_id)
-            if player_session:
-                enriched_players.append({
-                    'session_id': player_id,
-                    'username': player_session['username']
-                })
-        
-        enriched_room['players'] = enriched_players
-        return enriched_room
+        # Key is taken before building so a concurrent mutation leaves a stale key, not a stale hit
+        key = (self._room_versions.get(room_id, 0), self._sessions_version)
+        cached = self._enriched_cache.get(room_id)
+        if cached is not None and cached[0] == key:
+            return cached[1]
+        enriched = self._enrich_room(room)
+        self._enriched_cache[room_id] = (key, enriched)
+        return enriched
+    
+    def _enrich_room(self, room):
+        # Build the response explicitly instead of copying the whole room
+        usernames = self.usernames
+        return {
+            'id': room['id'],
+            'host': room['host'],
+            'name': room['name'],
+            'players': [{'session_id': pid, 'username': usernames[pid]}
+                        for pid in room['players'] if pid in usernames],
+            'max_players': room['max_players'],
+            'status': room['status'],
+            'settings': room['settings'],
+            'game_state': room['game_state'],
+            'created_at': room['created_at']
+        }
 
 # Global instance
 memory_service = MemoryService() 
\ No newline at end of file
@@ -16,6 +16,8 @@ class SelfPingService:
         self.ping_thread: Optional[threading.Thread] = None
         self.running = False
         self.health_url = None
+        self._stop_event = threading.Event()  # set by stop() to wake the loop immediately
+        self._session = None  # keep-alive HTTP session, created on the first ping
         
     def init_app(self, app):
         """Initialize the service with Flask app"""
@@ -53,6 +55,7 @@ class SelfPingService:
             return
             
         self.running = True
+        self._stop_event.clear()
         self.ping_thread = threading.Thread(target=self._ping_loop, daemon=True)
         self.ping_thread.start()
         logger.info(f"🏓 Self-ping service started - pinging {self.health_url} every {self.ping_interval} seconds")
@@ -60,6 +63,7 @@ class SelfPingService:
     def stop(self):
         """Stop the self-ping service"""
         self.running = False
+        self._stop_event.set()
         if self.ping_thread:
             self.ping_thread.join(timeout=5)
         logger.info("🏓 Self-ping service stopped")
@@ -67,7 +71,8 @@ class SelfPingService:
     def _ping_loop(self):
         """Main ping loop that runs in a separate thread"""
         # Wait before first ping to let the server fully start
-        time.sleep(30)
+        if self._stop_event.wait(30):
+            return
         
         while self.running:
             try:
@@ -75,22 +80,24 @@ class SelfPingService:
             except Exception as e:
                 logger.error(f"🏓 Self-ping error: {e}")
             
-            # Wait for the next ping
-            time.sleep(self.ping_interval)
+            # Wait for the next ping - returns early as soon as stop() is called
+            if self._stop_event.wait(self.ping_interval):
+                return
     
     def _perform_ping(self):
         """Perform a single ping to the health endpoint"""
         try:
-            start_time = time.time()
-            
-            response = requests.get(
-                self.health_url,
-                timeout=10,
-                headers={
+            # Reuse one session so pings ride a kept-alive connection instead of a new TCP/TLS handshake
+            if self._session is None:
+                self._session = requests.Session()
+                self._session.headers.update({
                     'User-Agent': 'Skribly-SelfPing/1.0.0',
                     'X-Self-Ping': 'true'
-                }
-            )
+                })
+            
+            start_time = time.time()
+            
+            response = self._session.get(self.health_url, timeout=10)
             
             response_time = time.time() - start_time
             
@@ -1,106 +1,222 @@
 import threading
 import time
+import logging
 from typing import Dict, Callable, Optional
-from flask_socketio import emit
 from app.services.memory_service import memory_service
+from app.services.word_service import word_service
 from app.socket_handlers import room_handlers
 
+SWEEP_INTERVAL = 60  # seconds between idle-room sweeps
+ROOM_IDLE_TIMEOUT = 3600  # delete rooms with no connected sockets for this long
+TICK_SLACK = 0.002  # seconds past a timer's whole second to wake, so its countdown has rolled over
+
+logger = logging.getLogger(__name__)
+
+# GameTimer states - every change goes through GameTimer._transition
+TIMER_IDLE = 0
+TIMER_RUNNING = 1
+TIMER_STOPPED = 2
+TIMER_DONE = 3
+
 class GameTimer:
+    """State for one room's countdown - driven by TimerService's shared tick loop"""
     def __init__(self, room_id: str, duration: int, callback: Callable, timer_type: str = 'generic'):
         self.room_id = room_id
         self.duration = duration
         self.callback = callback
         self.timer_type = timer_type
-        self.start_time = None
-        self.is_running = False
-        self.timer_thread = None
-        self.stop_event = threading.Event()
+        self.start_time_ns = None  # monotonic - immune to wall-clock adjustments
+        self.next_update = duration  # emit timer_update once remaining drops to this
+        self._state = TIMER_IDLE
+        self._state_lock = threading.Lock()
+    
+    @property
+    def is_running(self) -> bool:
+        return self._state == TIMER_RUNNING
+    
+    def _transition(self, expected: int, new: int) -> bool:
+        """Compare-and-swap the state; False if another thread got there first"""
+        with self._state_lock:
+            if self._state != expected:
+                return False
+            self._state = new
+            return True
     
     def start(self):
         """Start the timer"""
-        if self.is_running:
+        if not self._transition(TIMER_IDLE, TIMER_RUNNING):
             return
+        self.start_time_ns = time.monotonic_ns()
         
-        self.start_time = time.time()
-        self.is_running = True
-        self.stop_event.clear()
-        
-        # Start the timer thread
-        self.timer_thread = threading.Thread(target=self._run_timer)
-        self.timer_thread.daemon = True
-        self.timer_thread.start()
-        
-        print(f"⏰ Started {self.timer_type} timer for room {self.room_id} ({self.duration}s)")
+        logger.debug("⏰ Started %s timer for room %s (%ss)", self.timer_type, self.room_id, self.duration)
     
     def stop(self):
         """Stop the timer"""
-        if not self.is_running:
+        if not self._transition(TIMER_RUNNING, TIMER_STOPPED):
             return
+        # Release the callback closure right away - it can never fire now
+        self.callback = None
         
-        self.is_running = False
-        self.stop_event.set()
-        
-        if self.timer_thread and self.timer_thread.is_alive():
-            self.timer_thread.join(timeout=1.0)
-        
-        print(f"⏹️ Stopped {self.timer_type} timer for room {self.room_id}")
+        logger.debug("⏹️ Stopped %s timer for room %s", self.timer_type, self.room_id)
     
     def get_remaining_time(self) -> int:
         """Get remaining time in seconds"""
-        if not self.is_running or not self.start_time:
+        if not self.is_running or not self.start_time_ns:
             return 0
         
-        elapsed = time.time() - self.start_time
-        remaining = max(0, self.duration - int(elapsed))
-        return remaining
-    
-    def _run_timer(self):
-        """Run the timer with regular updates"""
-        try:
-            # Get timer service instance to access socketio
-            from app.services.timer_service import timer_service
-            
-            for remaining in range(self.duration, 0, -1):
-                if self.stop_event.wait(1):  # Wait 1 second or until stop event
-                    return
-                
-                # Emit timer update using stored socketio instance
-                if timer_service.socketio:
-                    timer_service.socketio.emit('timer_update', {
-                        'time_remaining': remaining,
-                        'phase': self.timer_type,
-                        'room_id': self.room_id
-                    }, room=self.room_id)
-                
-                # Check if room still exists
-                room_data = memory_service.get_room(self.room_id)
-                if not room_data:
-                    print(f"⚠️ Room {self.room_id} not found, stopping timer")
-                    return
-            
-            # Timer finished, execute callback
-            if self.is_running:
-                self.is_running = False
-                print(f"⏰ Timer {self.timer_type} finished for room {self.room_id}")
-                self.callback()
-                
-        except Exception as e:
-            print(f"❌ Error in timer {self.timer_type} for room {self.room_id}: {e}")
-            self.is_running = False
+        return max(0, self.duration - (time.monotonic_ns() - self.start_time_ns) // 1_000_000_000)
 
 class TimerService:
     def __init__(self):
         self.active_timers: Dict[str, GameTimer] = {}
         self.app = None
         self.socketio = None
+        self._game_handlers = None  # resolved in init_app - game_handlers imports this module
+        self._ticker = None  # single background task that drives every timer
+        self._ticker_lock = threading.Lock()
+        self._sweeper = None
+        self.update_interval = 1  # seconds between timer_update emits per room
+        self._room_last_seen: Dict[str, float] = {}  # room_id -> monotonic time a socket was last in it
     
     def init_app(self, app):
         """Initialize the timer service with Flask app"""
         self.app = app
         # Import socketio after app is created to avoid circular imports
         from app import socketio
+        from app.socket_handlers import game_handlers
         self.socketio = socketio
-        print("⏰ Timer service initialized")
+        self._game_handlers = game_handlers
+        self.update_interval = max(1, app.config.get('TIMER_UPDATE_INTERVAL', 1))
+        if self._sweeper is None:
+            self._sweeper = socketio.start_background_task(self._sweep_loop)
+        logger.info("⏰ Timer service initialized")
+    
+    def _sweep_loop(self):
+        """Periodically drop abandoned and expired rooms along with their timers"""
+        while True:
+            self.socketio.sleep(SWEEP_INTERVAL)
+            try:
+                self._sweep()
+                memory_service.cleanup_inactive_rooms()
+            except Exception as e:
+                logger.error("❌ Error sweeping idle rooms: %s", e)
+    
+    def _sweep(self):
+        """Delete rooms nobody has been connected to for ROOM_IDLE_TIMEOUT"""
+        now = time.monotonic()
+        # Local socket room membership - rooms with a connected socket count as active
+        socket_rooms = self.socketio.server.manager.rooms.get('/', {})
+        last_seen = self._room_last_seen
+        
+        for room_id in memory_service.get_room_id_set():
+            if socket_rooms.get(room_id):
+                last_seen[room_id] = now
+                continue
+            
+            if now - last_seen.setdefault(room_id, now) < ROOM_IDLE_TIMEOUT:
+                continue
+            
+            logger.info("🧹 Room %s idle for %ss, deleting", room_id, ROOM_IDLE_TIMEOUT)
+            self.stop_timer(room_id)
+            room_data = memory_service.get_room(room_id)
+            if room_data:
+                for player_id in tuple(room_data['players']):
+                    user_data = memory_service.get_user_session(player_id)
+                    if user_data and user_data.get('current_room') == room_id:
+                        user_data['current_room'] = None
+            memory_service.delete_room(room_id)
+        
+        # Forget rooms that are gone
+        live_rooms = memory_service.get_room_id_set()
+        for room_id in tuple(last_seen):
+            if room_id not in live_rooms:
+                del last_seen[room_id]
+    
+    def _ensure_ticker(self):
+        """Start the shared tick loop on first use"""
+        if self._ticker is not None:
+            return
+        with self._ticker_lock:
+            if self._ticker is None:
+                self._ticker = self.socketio.start_background_task(self._tick_loop)
+    
+    def _tick_loop(self):
+        """Wake on the timers' whole-second boundaries and advance every active timer in one pass"""
+        while True:
+            try:
+                self.socketio.sleep(self._seconds_to_next_tick())
+                self._tick()
+            except Exception as e:
+                # This is the only ticker - letting it die would freeze every game in the process
+                logger.error("❌ Error ticking timers: %s", e)
+    
+    def _seconds_to_next_tick(self) -> float:
+        """Time until the soonest whole second of any running timer - at most 1s"""
+        # A fixed sleep(1) drifts against each timer's start, skipping countdown values and
+        # firing up to a second late, so the wake-up is derived from the timers' own phase
+        now_ns = time.monotonic_ns()
+        wait_ns = 1_000_000_000
+        for timer in tuple(self.active_timers.values()):
+            start_ns = timer.start_time_ns
+            if start_ns is None or not timer.is_running:
+                continue
+            wait_ns = min(wait_ns, 1_000_000_000 - (now_ns - start_ns) % 1_000_000_000)
+        return wait_ns / 1_000_000_000 + TICK_SLACK
+    
+    def _tick(self):
+        """Emit timer updates for all rooms and fire the timers that ran out"""
+        now_ns = time.monotonic_ns()
+        live_rooms = memory_service.get_room_id_set()
+        # Snapshot - callbacks and request threads start and stop timers while we iterate
+        for room_id, timer in tuple(self.active_timers.items()):
+            if not timer.is_running:
+                continue
+            try:
+                # Stop timers whose room has gone away
+                if room_id not in live_rooms:
+                    logger.warning("⚠️ Room %s not found, stopping timer", room_id)
+                    timer.stop()
+                    self._discard_timer(room_id, timer)
+                    continue
+                
+                remaining = timer.duration - (now_ns - timer.start_time_ns) // 1_000_000_000
+                if remaining > 0:
+                    # Clients count down locally from time_limit - only resync at milestones,
+                    # and not at all while nobody is connected to the room
+                    if remaining <= timer.next_update and room_handlers.room_has_members(room_id):
+                        timer.next_update = remaining - self.update_interval
+                        self.socketio.emit('timer_update', {
+                            'time_remaining': remaining,
+                            'phase': timer.timer_type,
+                            'room_id': room_id
+                        }, room=room_id)
+                    continue
+                
+                # Timer finished - only fire if stop() didn't win the race
+                if not timer._transition(TIMER_RUNNING, TIMER_DONE):
+                    continue
+                self._discard_timer(room_id, timer)
+                logger.debug("⏰ Timer %s finished for room %s", timer.timer_type, room_id)
+                callback, timer.callback = timer.callback, None
+                # Phase transitions run as their own task so their emits don't hold up other rooms' ticks
+                self.socketio.start_background_task(self._fire, room_id, timer.timer_type, callback)
+                
+            except Exception as e:
+                logger.error("❌ Error in timer %s for room %s: %s", timer.timer_type, room_id, e)
+                timer._transition(TIMER_RUNNING, TIMER_DONE)
+                self._discard_timer(room_id, timer)
+    
+    def _fire(self, room_id: str, timer_type: str, callback: Callable):
+        """Run a finished timer's callback"""
+        try:
+            callback()
+        except Exception as e:
+            logger.error("❌ Error in timer %s for room %s: %s", timer_type, room_id, e)
+    
+    def _discard_timer(self, room_id: str, timer: GameTimer):
+        """Drop a finished timer unless a newer one already replaced it"""
+        if self.active_timers.get(room_id) is timer:
+            del self.active_timers[room_id]
     
     def start_word_selection_timer(self, room_id: str, duration: int = 10) -> bool:
         """Start word selection timer"""
@@ -141,25 +257,25 @@ class TimerService:
             
             # Create and start new timer
             timer = GameTimer(room_id, duration, callback, timer_type)
-            self.active_timers[room_id] = timer
             timer.start()
+            self.active_timers[room_id] = timer
+            self._ensure_ticker()
             
             return True
         except Exception as e:
-            print(f"❌ Error starting {timer_type} timer for room {room_id}: {e}")
+            logger.error("❌ Error starting %s timer for room %s: %s", timer_type, room_id, e)
             return False
     
     def stop_timer(self, room_id: str) -> bool:
         """Stop timer for a room"""
         try:
-            if room_id in self.active_timers:
-                timer = self.active_timers[room_id]
+            timer = self.active_timers.pop(room_id, None)
+            if timer:
                 timer.stop()
-                del self.active_timers[room_id]
                 return True
             return False
         except Exception as e:
-            print(f"❌ Error stopping timer for room {room_id}: {e}")
+            logger.error("❌ Error stopping timer for room %s: %s", room_id, e)
             return False
     
     def get_remaining_time(self, room_id: str) -> int:
@@ -181,9 +297,6 @@ class TimerService:
     def _handle_word_selection_timeout(self, room_id: str):
         """Handle word selection timeout - auto-select random word"""
         try:
-            from app.services.word_service import word_service
-            from app import socketio
-            
             room_data = memory_service.get_room(room_id)
             if not room_data:
                 return
@@ -193,29 +306,25 @@ class TimerService:
             word = word_service.get_random_word(difficulty)
             
             room_data['game_state']['current_word'] = word
+            room_data['game_state']['current_word_lower'] = word.lower()
             room_data['game_state']['words_used'].append(word)
             room_data['game_state']['turn_start_time'] = time.time()
-            room_data['game_state']['players_guessed'] = []
+            room_data['game_state']['players_guessed'] = set()
             memory_service.update_room(room_id, room_data)
             
-            print(f"⏰ Auto-selected word '{word}' for room {room_id}")
+            logger.debug("⏰ Auto-selected word '%s' for room %s", word, room_id)
             
             # Get drawer and draw time from room data
             drawer_id = room_data['game_state']['current_drawer']
             draw_time = room_data['settings']['draw_time']
             
             # Start drawing phase manually to avoid context issues
-            print(f"🔥 DEBUG: About to start drawing phase for room {room_id}")
+            logger.debug("About to start drawing phase for room %s", room_id)
             try:
                 # Notify all players that word has been auto-selected
                 if self.socketio:
-                    # Find drawer's session_id for proper event targeting
-                    from app.socket_handlers.room_handlers import authenticated_sockets
-                    drawer_session_id = None
-                    for session_id, user_info in authenticated_sockets.items():
-                        if user_info['user_id'] == drawer_id:
-                            drawer_session_id = session_id
-                            break
+                    # Find drawer's socket for proper event targeting
+                    drawer_session_id = room_handlers.user_sockets.get(drawer_id)
                     
                     if drawer_session_id:
                         # Notify drawer with full word
@@ -228,21 +337,21 @@ class TimerService:
                         }, room=drawer_session_id)
                     
                     # Notify other players without the actual word
-                    word_hint = '_' * len(word.replace(' ', ''))
-                    for session_id, user_info in authenticated_sockets.items():
-                        if user_info['user_id'] in room_data['players'] and user_info['user_id'] != drawer_id:
-                            self.socketio.emit('word_selected', {
-                                'word_hint': word_hint,
-                                'word_length': len(word),
-                                'time_limit': draw_time,
-                                'drawer_id': drawer_id,
-                                'phase': 'drawing',
-                                'auto_selected': True
-                            }, room=session_id)
+                    word_hint = word_service.get_masked_hint(word)
+                    hint_payload = {
+                        'word_hint': word_hint,
+                        'word_length': len(word),
+                        'time_limit': draw_time,
+                        'drawer_id': drawer_id,
+                        'phase': 'drawing',
+                        'auto_selected': True
+                    }
+                    # One emit for the whole room, skipping the drawer's socket
+                    self.socketio.emit('word_selected', hint_payload, room=room_id, skip_sid=drawer_session_id)
                     
-                    print(f"🔥 DEBUG: Word auto-selection events emitted successfully")
+                    logger.debug("Word auto-selection events emitted successfully")
                 else:
-                    print(f"🔥 DEBUG: No socketio instance available")
+                    logger.debug("No socketio instance available")
                 
                 # Start drawing timer using the manual approach
                 def on_drawing_timeout():
@@ -253,30 +362,26 @@ class TimerService:
                                 'message': 'Time is up!'
                             }, room=room_id)
                     except Exception as e:
-                        print(f"❌ Error in drawing timeout: {e}")
+                        logger.error("❌ Error in drawing timeout: %s", e)
                 
                 timer_service.start_drawing_timer(room_id, draw_time, on_drawing_timeout)
                 
-                print(f"🔥 DEBUG: Drawing phase started successfully for room {room_id}")
+                logger.debug("Drawing phase started successfully for room %s", room_id)
                 
             except Exception as e:
-                print(f"🔥 DEBUG: Error starting drawing phase: {e}")
-                import traceback
-                traceback.print_exc()
+                logger.error("❌ Error starting drawing phase: %s", e, exc_info=True)
             
         except Exception as e:
-            print(f"❌ Error handling word selection timeout for room {room_id}: {e}")
+            logger.error("❌ Error handling word selection timeout for room %s: %s", room_id, e)
     
     def _handle_drawing_timeout(self, room_id: str):
         """Handle drawing timeout - end current turn"""
         try:
-            from app import socketio
-            
             room_data = memory_service.get_room(room_id)
             if not room_data:
                 return
             
-            print(f"⏰ Drawing time ended for room {room_id}")
+            logger.debug("⏰ Drawing time ended for room %s", room_id)
             
             # End turn without context dependencies
             try:
@@ -285,66 +390,58 @@ class TimerService:
                         'room_id': room_id,
                         'message': 'Time is up!'
                     }, room=room_id)
-                    print(f"⏰ Turn timeout event emitted for room {room_id}")
+                    logger.debug("⏰ Turn timeout event emitted for room %s", room_id)
                 else:
-                    print(f"❌ No socketio instance for turn timeout in room {room_id}")
+                    logger.error("❌ No socketio instance for turn timeout in room %s", room_id)
             except Exception as e:
-                print(f"❌ Error ending turn: {e}")
+                logger.error("❌ Error ending turn: %s", e)
             
         except Exception as e:
-            print(f"❌ Error handling drawing timeout for room {room_id}: {e}")
+            logger.error("❌ Error handling drawing timeout for room %s: %s", room_id, e)
     
     def _handle_results_timeout(self, room_id: str):
         """Handle results timeout - start next turn or end game"""
         try:
-            from app import socketio
-            
             room_data = memory_service.get_room(room_id)
             if not room_data:
                 return
             
-            print(f"⏰ Results time ended for room {room_id}")
+            logger.debug("⏰ Results time ended for room %s", room_id)
             
             # Start next turn/round with proper Flask context
             try:
                 if self.app:
                     with self.app.app_context():
-                        from app.socket_handlers.game_handlers import _start_next_turn_or_round
-                        _start_next_turn_or_round(room_id)
+                        self._game_handlers._start_next_turn_or_round(room_id)
                 else:
-                    from app.socket_handlers.game_handlers import _start_next_turn_or_round
-                    _start_next_turn_or_round(room_id)
+                    self._game_handlers._start_next_turn_or_round(room_id)
             except Exception as e:
-                print(f"❌ Error starting next turn/round in context: {e}")
+                logger.error("❌ Error starting next turn/round in context: %s", e)
             
         except Exception as e:
-            print(f"❌ Error handling results timeout for room {room_id}: {e}")
+            logger.error("❌ Error handling results timeout for room %s: %s", room_id, e)
     
     def _handle_intermission_timeout(self, room_id: str):
         """Handle intermission timeout - start new round"""
         try:
-            from app import socketio
-            
             room_data = memory_service.get_room(room_id)
             if not room_data:
                 return
             
-            print(f"⏰ Intermission ended for room {room_id}")
+            logger.debug("⏰ Intermission ended for room %s", room_id)
             
             # Start new round with proper Flask context
             try:
                 if self.app:
                     with self.app.app_context():
-                        from app.socket_handlers.game_handlers import _start_new_round
-                        _start_new_round(room_id)
+                        self._game_handlers._start_new_round(room_id)
                 else:
-                    from app.socket_handlers.game_handlers import _start_new_round
-                    _start_new_round(room_id)
+                    self._game_handlers._start_new_round(room_id)
             except Exception as e:
-                print(f"❌ Error starting new round in context: {e}")
+                logger.error("❌ Error starting new round in context: %s", e)
             
         except Exception as e:
-            print(f"❌ Error handling intermission timeout for room {room_id}: {e}")
+            logger.error("❌ Error handling intermission timeout for room %s: %s", room_id, e)
     
     def get_timer_stats(self) -> Dict[str, any]:
         """Get statistics about active timers"""
@@ -353,7 +450,7 @@ class TimerService:
             'timers': {}
         }
         
-        for room_id, timer in self.active_timers.items():
+        for room_id, timer in tuple(self.active_timers.items()):
             stats['timers'][room_id] = {
                 'type': timer.timer_type,
                 'remaining': timer.get_remaining_time(),
@@ -1,41 +1,119 @@
 import json
+import logging
 import random
 import os
-from typing import List, Dict
+import sys
+import threading
+from functools import lru_cache
+from typing import List, Dict, FrozenSet, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+@lru_cache(maxsize=1024)
+def _letter_positions(word: str) -> Tuple[int, ...]:
+    """Indices of the non-space characters in word, computed once per word"""
+    return tuple(i for i, char in enumerate(word) if char != ' ')
+
+@lru_cache(maxsize=1024)
+def _hint_template(word: str) -> Tuple[str, ...]:
+    """Fully masked hint characters for word - underscores with its spaces kept"""
+    return tuple(' ' if char == ' ' else '_' for char in word)
+
+def _reveal_letters(word: str, revealed_positions) -> str:
+    """Masked hint for word with the letters at revealed_positions filled in"""
+    # Start from the cached mask and fill in only the revealed letters
+    hint = list(_hint_template(word))
+    size = len(hint)
+    for i in set(revealed_positions):
+        if 0 <= i < size and hint[i] != ' ':
+            hint[i] = word[i].upper()
+    
+    return ' '.join(hint)
+
+@lru_cache(maxsize=2048)
+def _progressive_hint(word: str, letters_to_reveal: int) -> str:
+    """Build the hint for one (word, letters revealed) step - the same few strings every turn"""
+    # Get letter positions (excluding spaces)
+    letter_positions = _letter_positions(word)
+    
+    if not letter_positions:
+        return word
+    
+    # Strategically reveal letters (first, last, then middle)
+    revealed_positions = []
+    if letters_to_reveal >= 1 and len(letter_positions) >= 1:
+        revealed_positions.append(letter_positions[0])  # First letter
+    if letters_to_reveal >= 2 and len(letter_positions) >= 2:
+        revealed_positions.append(letter_positions[-1])  # Last letter  
+    if letters_to_reveal >= 3 and len(letter_positions) >= 3:
+        middle_pos = letter_positions[len(letter_positions) // 2]
+        revealed_positions.append(middle_pos)  # Middle letter
+    
+    return _reveal_letters(word, revealed_positions)
+
+DIFFICULTIES = ('easy', 'medium', 'hard')
+
+# Underscore runs by letter count, shared by every masked hint of that length
+_UNDERSCORES: Dict[int, str] = {}
 
 class WordService:
     def __init__(self):
-        self.words_cache: Dict[str, List[str]] = {}
+        self.words_cache: Dict[str, Tuple[str, ...]] = {}  # immutable after load
+        self._words_lower: Dict[str, FrozenSet[str]] = {}  # lowercased lookup sets per difficulty
+        self._by_length: Dict[str, Dict[int, Tuple[str, ...]]] = {}  # difficulty -> length -> words
+        self._by_initial: Dict[str, Dict[str, Tuple[str, ...]]] = {}  # difficulty -> first letter -> words
+        self._load_lock = threading.Lock()
         self.app = None
-        self._load_words()
     
     def init_app(self, app):
         """Initialize the word service with Flask app"""
         self.app = app
-        print("📚 Word service initialized")
+        logger.info("📚 Word service initialized")
     
-    def _load_words(self):
-        """Load words from JSON files"""
-        try:
-            current_dir = os.path.dirname(os.path.abspath(__file__))
-            words_dir = os.path.join(current_dir, '..', 'static', 'words')
-            
-            difficulties = ['easy', 'medium', 'hard']
+    def _get_words(self, difficulty: str) -> Optional[Tuple[str, ...]]:
+        """Get a difficulty's word list, loading it on first use (None for unknown difficulties)"""
+        words = self.words_cache.get(difficulty)
+        if words is None and difficulty in DIFFICULTIES:
+            words = self._load_words(difficulty)
+        return words
+    
+    def _load_words(self, difficulty: str) -> Tuple[str, ...]:
+        """Load one difficulty's words from its JSON file"""
+        with self._load_lock:
+            if difficulty in self.words_cache:
+                return self.words_cache[difficulty]
             
-            for difficulty in difficulties:
-                file_path = os.path.join(words_dir, f'{difficulty}.json')
+            try:
+                current_dir = os.path.dirname(os.path.abspath(__file__))
+                file_path = os.path.join(current_dir, '..', 'static', 'words', f'{difficulty}.json')
                 if os.path.exists(file_path):
                     with open(file_path, 'r', encoding='utf-8') as f:
-                        self.words_cache[difficulty] = json.load(f)
-                    print(f"📖 Loaded {len(self.words_cache[difficulty])} {difficulty} words")
+                        words = tuple(json.load(f))
+                    logger.info("📖 Loaded %s %s words", len(words), difficulty)
                 else:
-                    print(f"⚠️ Word file not found: {file_path}")
+                    logger.warning("⚠️ Word file not found: %s", file_path)
                     # Fallback words
-                    self.words_cache[difficulty] = self._get_fallback_words(difficulty)
-                    
-        except Exception as e:
-            print(f"❌ Error loading words: {e}")
-            self._load_fallback_words()
+                    words = tuple(self._get_fallback_words(difficulty))
+            except Exception as e:
+                logger.error("❌ Error loading %s words: %s", difficulty, e)
+                words = tuple(self._get_fallback_words(difficulty))
+                logger.warning("🔄 Loaded fallback %s words", difficulty)
+            
+            # Interned so words handed out, stored in words_used and compared share one object
+            words = tuple(sys.intern(w) for w in words)
+            
+            # Indexes first, so anyone who sees the list also sees them
+            self._words_lower[difficulty] = frozenset(w.lower() for w in words)
+            by_length: Dict[int, List[str]] = {}
+            by_initial: Dict[str, List[str]] = {}
+            for w in words:
+                by_length.setdefault(len(w), []).append(w)
+                if w:
+                    by_initial.setdefault(w[0].lower(), []).append(w)
+            self._by_length[difficulty] = {k: tuple(v) for k, v in by_length.items()}
+            self._by_initial[difficulty] = {k: tuple(v) for k, v in by_initial.items()}
+            self.words_cache[difficulty] = words
+            return words
     
     def _get_fallback_words(self, difficulty: str) -> List[str]:
         """Get fallback words if JSON files are not available"""
@@ -55,26 +133,32 @@ class WordService:
         }
         return fallback_words.get(difficulty, fallback_words['easy'])
     
-    def _load_fallback_words(self):
-        """Load fallback words if all else fails"""
-        self.words_cache = {
-            'easy': self._get_fallback_words('easy'),
-            'medium': self._get_fallback_words('medium'),
-            'hard': self._get_fallback_words('hard')
-        }
-        print("🔄 Loaded fallback words")
-    
     def get_random_words(self, difficulty: str = 'medium', count: int = 3) -> List[str]:
         """Get random words for selection"""
-        if difficulty not in self.words_cache:
-            difficulty = 'medium'
+        available_words = self._get_words(difficulty)
+        if available_words is None:
+            available_words = self._get_words('medium')
         
-        available_words = self.words_cache[difficulty]
         if len(available_words) < count:
-            return available_words[:]
+            return list(available_words)
         
+        if count <= 4:
+            return self._sample_small(available_words, count)
         return random.sample(available_words, count)
     
+    @staticmethod
+    def _sample_small(words, count):
+        """Pick count distinct words by drawing random indices - cheaper than random.sample for tiny counts"""
+        size = len(words)
+        picked = set()
+        result = []
+        while len(result) < count:
+            index = random.randrange(size)
+            if index not in picked:
+                picked.add(index)
+                result.append(words[index])
+        return result
+    
     def get_random_word(self, difficulty: str = 'medium') -> str:
         """Get a single random word"""
         words = self.get_random_words(difficulty, 1)
@@ -82,9 +166,17 @@ class WordService:
     
     def validate_word(self, word: str, difficulty: str = 'medium') -> bool:
         """Check if a word exists in the given difficulty"""
-        if difficulty not in self.words_cache:
+        if self._get_words(difficulty) is None:
             return False
-        return word.lower() in [w.lower() for w in self.words_cache[difficulty]]
+        return word.lower() in self._words_lower[difficulty]
+    
+    def get_masked_hint(self, word: str) -> str:
+        """Get the fully hidden hint for word - one underscore per non-space character"""
+        letters = len(word) - word.count(' ')
+        hint = _UNDERSCORES.get(letters)
+        if hint is None:
+            hint = _UNDERSCORES.setdefault(letters, '_' * letters)
+        return hint
     
     def get_word_hint(self, word, revealed_positions=None):
         """
@@ -102,24 +194,14 @@ class WordService:
             revealed_positions = []
         elif isinstance(revealed_positions, int):
             # Backward compatibility: if an integer is passed, reveal that many random letters
-            import random
-            letter_positions = [i for i, char in enumerate(word) if char != ' ']
+            letter_positions = _letter_positions(word)
             if letter_positions:
                 num_to_reveal = min(revealed_positions, len(letter_positions))
                 revealed_positions = random.sample(letter_positions, num_to_reveal)
             else:
                 revealed_positions = []
         
-        hint = []
-        for i, char in enumerate(word.lower()):
-            if char == ' ':
-                hint.append(' ')
-            elif i in revealed_positions:
-                hint.append(char.upper())
-            else:
-                hint.append('_')
-        
-        return ' '.join(hint)
+        return _reveal_letters(word, revealed_positions)
     
     def get_progressive_hint(self, word, elapsed_seconds):
         """
@@ -133,45 +215,25 @@ class WordService:
             String hint with revealed letters
         """
         if not word or elapsed_seconds < 10:
-            return '_' * len(word.replace(' ', ''))
+            return self.get_masked_hint(word)
         
         # Calculate how many letters to reveal (max 3, one every 10 seconds after initial 10s)
-        letters_to_reveal = min(3, (elapsed_seconds - 10) // 10 + 1)
-        
-        # Get letter positions (excluding spaces)
-        letter_positions = [i for i, char in enumerate(word) if char != ' ']
-        
-        if not letter_positions:
-            return word
-        
-        # Strategically reveal letters (first, last, then middle)
-        revealed_positions = []
-        if letters_to_reveal >= 1 and len(letter_positions) >= 1:
-            revealed_positions.append(letter_positions[0])  # First letter
-        if letters_to_reveal >= 2 and len(letter_positions) >= 2:
-            revealed_positions.append(letter_positions[-1])  # Last letter  
-        if letters_to_reveal >= 3 and len(letter_positions) >= 3:
-            middle_pos = letter_positions[len(letter_positions) // 2]
-            revealed_positions.append(middle_pos)  # Middle letter
-        
-        return self.get_word_hint(word, revealed_positions)
+        letters_to_reveal = min(3, int(elapsed_seconds - 10) // 10 + 1)
+        return _progressive_hint(word, letters_to_reveal)
     
     def get_similar_words(self, word: str, difficulty: str = 'medium', count: int = 5) -> List[str]:
         """Get words similar in length or starting letter"""
-        if difficulty not in self.words_cache:
+        available_words = self._get_words(difficulty)
+        if available_words is None:
             return []
         
-        available_words = self.words_cache[difficulty]
-        word_len = len(word)
-        word_start = word[0].lower() if word else ''
+        word_lower = word.lower()
         
-        # Find words with similar length or starting letter
-        similar = []
-        for w in available_words:
-            if w.lower() != word.lower():
-                if (len(w) == word_len or 
-                    (w and w[0].lower() == word_start)):
-                    similar.append(w)
+        # Union of the same-length and same-initial buckets, minus the word itself
+        candidates = set(self._by_length[difficulty].get(len(word), ()))
+        if word:
+            candidates.update(self._by_initial[difficulty].get(word_lower[0], ()))
+        similar = [w for w in candidates if w.lower() != word_lower]
         
         return random.sample(similar, min(count, len(similar)))
     
@@ -184,8 +246,8 @@ class WordService:
     def get_word_stats(self) -> Dict[str, int]:
         """Get statistics about loaded words"""
         return {
-            difficulty: len(words) 
-            for difficulty, words in self.words_cache.items()
+            difficulty: len(self._get_words(difficulty))
+            for difficulty in DIFFICULTIES
         }
 
 # Global instance
@@ -1,313 +1,347 @@
-from flask import session, request
-from flask_socketio import emit
+from flask import session, request, current_app
+from flask_socketio import emit, disconnect
 from app import socketio
 from app.services.memory_service import memory_service
-from app.socket_handlers.room_handlers import authenticated_sockets
+from app.socket_handlers.room_handlers import (
+    authenticated_sockets, draw_rate_buckets, active_strokes, invalid_draw_counts, room_has_members
+)
+import functools
+import logging
+import threading
 import time
 
-# Drawing-related socket handlers will be implemented in Phase 2
-# This is a placeholder for Phase 1
+try:
+    import msgpack
+except ImportError:  # optional - only needed for DRAW_BATCH_BINARY
+    msgpack = None
 
-@socketio.on('draw_start')
-def handle_draw_start(data):
-    """Handle start of a drawing stroke"""
+logger = logging.getLogger(__name__)
+
+# Bound once - skips the attribute lookups on every drawing event
+_get_session = memory_service.get_user_session
+_get_room = memory_service.get_room
+
+# Exact types only - type() lookups stay cheap on the highest-rate handlers (and reject bools)
+_NUMBER_TYPES = frozenset((int, float))
+_VALID_TOOLS = frozenset(('brush', 'eraser'))
+
+# Malformed draw_move packets are dropped without a reply; past this many the socket is disconnected
+MAX_INVALID_MOVES = 50
+
+# draw_move points waiting for the flusher: room_id -> (drawer sid, [x0, y0, x1, y1, ...])
+# Sent as draw_batch {'t': timestamp, 'pts': flat coordinate list} - compact keys, no per-point arrays
+_pending_strokes = {}
+_pending_lock = threading.Lock()
+_flusher = None
+_pack_batch = None  # msgpack.packb when batches go out as binary draw_batch_bin frames
+
+def _start_flusher(interval, binary):
+    """Spawn the draw_batch flusher on first use"""
+    global _flusher, _pack_batch
+    with _pending_lock:
+        if _flusher is not None:
+            return
+        if binary:
+            if msgpack is None:
+                logger.warning("⚠️ DRAW_BATCH_BINARY is set but msgpack is not installed - sending JSON batches")
+            else:
+                _pack_batch = msgpack.packb
+        _flusher = socketio.start_background_task(_flush_loop, interval)
+
+def _send_batch(room_id, sid, points, timestamp):
+    """Emit one room's buffered points to everyone but the drawer"""
+    if _pack_batch is not None:
+        # MessagePack [timestamp, [x0, y0, ...]] - Socket.IO sends bytes as a binary attachment
+        socketio.emit('draw_batch_bin', _pack_batch((timestamp, points)), room=room_id, skip_sid=sid)
+    else:
+        socketio.emit('draw_batch', {'t': timestamp, 'pts': points}, room=room_id, skip_sid=sid)
+
+def _flush_loop(interval):
+    """Emit every room's buffered points as one draw_batch per interval"""
+    global _pending_strokes, _flusher
     try:
+        while True:
+            socketio.sleep(interval)
+            with _pending_lock:
+                pending, _pending_strokes = _pending_strokes, {}
+            if not pending:
+                continue
+            # One timestamp per flush - the points in a batch are at most one interval apart
+            timestamp = time.time()
+            for room_id, (sid, points) in pending.items():
+                try:
+                    _send_batch(room_id, sid, points, timestamp)
+                except Exception as e:
+                    logger.error("❌ Error flushing draw batch for room %s: %s", room_id, e)
+    finally:
+        # Let handle_draw_move fall back to direct emits (and the next start restart us) instead of buffering forever
+        with _pending_lock:
+            _flusher = None
+
+def _flush_room(room_id):
+    """Send a room's buffered points now so they stay ahead of the next start/end"""
+    with _pending_lock:
+        entry = _pending_strokes.pop(room_id, None)
+    if entry:
+        sid, points = entry
+        _send_batch(room_id, sid, points, time.time())
+
+def _require_room(fn):
+    """Resolve the sender's user, session and room, then call fn(data, user_id, room_id, room_data, user_data)"""
+    @functools.wraps(fn)
+    def wrapper(data):
         # Try to get user_id from authenticated sockets store first, then fallback to session
-        authenticated_user = authenticated_sockets.get(request.sid)
-        user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
+        try:
+            user_id = authenticated_sockets[request.sid]['user_id']
+        except KeyError:
+            user_id = session.get('user_id')
         
         if not user_id:
             emit('error', {'message': 'Authentication required'})
             return
         
-        user_data = memory_service.get_user_session(user_id)
+        user_data = _get_session(user_id)
         if not user_data or not user_data.get('current_room'):
             emit('error', {'message': 'Not in a room'})
             return
         
         room_id = user_data['current_room']
-        room_data = memory_service.get_room(room_id)
+        room_data = _get_room(room_id)
         
         if not room_data:
             emit('error', {'message': 'Room not found'})
             return
         
-        # Check if user is allowed to draw (current drawer)
-        current_drawer = room_data['game_state'].get('current_drawer')
+        return fn(data, user_id, room_id, room_data, user_data)
+    return wrapper
+
+def _rate_limited(fn):
+    """Silently drop events beyond DRAW_MOVE_RATE per second per socket (token bucket)"""
+    @functools.wraps(fn)
+    def wrapper(data):
+        rate = current_app.config['DRAW_MOVE_RATE']
+        if rate > 0:
+            sid = request.sid
+            now = time.monotonic_ns()
+            tokens, last = draw_rate_buckets.get(sid, (rate, now))
+            tokens = min(rate, tokens + (now - last) * rate / 1_000_000_000)
+            if tokens < 1:
+                draw_rate_buckets[sid] = (tokens, now)
+                return
+            draw_rate_buckets[sid] = (tokens - 1, now)
+        return fn(data)
+    return wrapper
+
+def _require_drawer(fn):
+    """Like _require_room, but only lets the current drawer through (anyone while no one is drawing)"""
+    @_require_room
+    @functools.wraps(fn)
+    def wrapper(data, user_id, room_id, room_data, user_data):
+        current_drawer = room_data['current_drawer']
         if current_drawer and current_drawer != user_id:
             emit('error', {'message': 'Not your turn to draw'})
             return
-        
-        # Validate drawing data
-        x = data.get('x')
-        y = data.get('y')
-        color = data.get('color', '#000000')
-        size = data.get('size', 5)
-        tool = data.get('tool', 'brush')
-        
-        if not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
-            emit('error', {'message': 'Invalid coordinates'})
-            return
-        
-        if not isinstance(size, (int, float)) or size < 1 or size > 50:
-            emit('error', {'message': 'Invalid brush size'})
-            return
-        
-        if tool not in ['brush', 'eraser']:
-            emit('error', {'message': 'Invalid tool'})
-            return
-        
-        # Broadcast drawing data to all players in room except sender
-        drawing_data = {
-            'type': 'start',
-            'x': x,
-            'y': y,
-            'color': color,
-            'size': size,
-            'tool': tool,
-            'timestamp': time.time()
-        }
-        
-        print(f"🎨 Broadcasting draw_start: {drawing_data}")
-        emit('draw_data', drawing_data, room=room_id, include_self=False)
-        
-    except Exception as e:
-        print(f"❌ Error in draw_start: {e}")
-        emit('error', {'message': str(e)})
+        return fn(data, user_id, room_id, room_data, user_data)
+    return wrapper
+
+def _in_stroke(fn):
+    """Reuse draw_start's lookups and authorization for the rest of the stroke"""
+    resolved = _require_drawer(fn)
+    @functools.wraps(fn)
+    def wrapper(data):
+        stroke = active_strokes.get(request.sid)
+        if stroke is None:
+            return resolved(data)
+        
+        # Drawer changes drop the room's strokes (drop_room_strokes), so only leaving needs checking
+        user_id, room_id, room_data, user_data = stroke
+        if user_data.get('current_room') != room_id:
+            active_strokes.pop(request.sid, None)
+            return resolved(data)
+        
+        return fn(data, user_id, room_id, room_data, user_data)
+    return wrapper
+
+@socketio.on('draw_start')
+@_require_drawer
+def handle_draw_start(data, user_id, room_id, room_data, user_data):
+    """Handle start of a drawing stroke"""
+    # Validate drawing data
+    x = data.get('x')
+    y = data.get('y')
+    color = data.get('color', '#000000')
+    size = data.get('size', 5)
+    tool = data.get('tool', 'brush')
+    
+    if type(x) not in _NUMBER_TYPES or type(y) not in _NUMBER_TYPES:
+        emit('error', {'message': 'Invalid coordinates'})
+        return
+    
+    if type(size) not in _NUMBER_TYPES or size < 1 or size > 50:
+        emit('error', {'message': 'Invalid brush size'})
+        return
+    
+    if tool not in _VALID_TOOLS:
+        emit('error', {'message': 'Invalid tool'})
+        return
+    
+    active_strokes[request.sid] = (user_id, room_id, room_data, user_data)
+    
+    if not room_has_members(room_id, skip_sid=request.sid):
+        return
+    
+    # Pixel canvases - whole numbers encode to a fraction of a float's JSON
+    if current_app.config['DRAW_INTEGER_COORDS']:
+        x, y, size = round(x), round(y), round(size)
+    
+    if current_app.config['DRAW_BATCH_INTERVAL'] > 0:
+        if _flusher is None:
+            _start_flusher(current_app.config['DRAW_BATCH_INTERVAL'], current_app.config['DRAW_BATCH_BINARY'])
+        _flush_room(room_id)
+    
+    # Broadcast drawing data to all players in room except sender
+    drawing_data = {
+        'type': 'start',
+        'x': x,
+        'y': y,
+        'color': color,
+        'size': size,
+        'tool': tool,
+        'timestamp': time.time()
+    }
+    
+    logger.debug("🎨 Broadcasting draw_start: %s", drawing_data)
+    emit('draw_data', drawing_data, room=room_id, include_self=False)
 
 @socketio.on('draw_move')
-def handle_draw_move(data):
+@_rate_limited
+@_in_stroke
+def handle_draw_move(data, user_id, room_id, room_data, user_data):
     """Handle drawing stroke movement"""
-    try:
-        # Try to get user_id from authenticated sockets store first, then fallback to session
-        authenticated_user = authenticated_sockets.get(request.sid)
-        user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
-        
-        if not user_id:
-            emit('error', {'message': 'Authentication required'})
-            return
-        
-        user_data = memory_service.get_user_session(user_id)
-        if not user_data or not user_data.get('current_room'):
-            emit('error', {'message': 'Not in a room'})
-            return
-        
-        room_id = user_data['current_room']
-        room_data = memory_service.get_room(room_id)
-        
-        if not room_data:
-            emit('error', {'message': 'Room not found'})
-            return
-        
-        # Check if user is allowed to draw
-        current_drawer = room_data['game_state'].get('current_drawer')
-        if current_drawer and current_drawer != user_id:
-            emit('error', {'message': 'Not your turn to draw'})
-            return
-        
-        # Validate drawing data
-        x = data.get('x')
-        y = data.get('y')
-        
-        if not isinstance(x, (int, float)) or not isinstance(y, (int, float)):
-            emit('error', {'message': 'Invalid coordinates'})
-            return
-        
-        # Broadcast drawing data to all players in room except sender
-        drawing_data = {
-            'type': 'move',
-            'x': x,
-            'y': y,
-            'timestamp': time.time()
-        }
-        
-        emit('draw_data', drawing_data, room=room_id, include_self=False)
-        
-    except Exception as e:
-        print(f"❌ Error in draw_move: {e}")
-        emit('error', {'message': str(e)})
+    # Validate drawing data
+    x = data.get('x')
+    y = data.get('y')
+    
+    if type(x) not in _NUMBER_TYPES or type(y) not in _NUMBER_TYPES:
+        # No error reply at move rate - a noisy client would only get a flood back
+        invalid = invalid_draw_counts.get(request.sid, 0) + 1
+        invalid_draw_counts[request.sid] = invalid
+        if invalid > MAX_INVALID_MOVES:
+            logger.warning("⚠️ Disconnecting %s after %s malformed draw_move packets", request.sid, invalid)
+            disconnect()
+        return
+    
+    if not room_has_members(room_id, skip_sid=request.sid):
+        return
+    
+    if current_app.config['DRAW_INTEGER_COORDS']:
+        x, y = round(x), round(y)
+    
+    # Batching enabled - buffer the point for the flusher instead of emitting it
+    if _flusher is not None:
+        with _pending_lock:
+            entry = _pending_strokes.get(room_id)
+            if entry is None:
+                _pending_strokes[room_id] = (request.sid, [x, y])
+            else:
+                entry[1] += (x, y)
+        return
+    
+    # Broadcast drawing data to all players in room except sender
+    drawing_data = {
+        'type': 'move',
+        'x': x,
+        'y': y,
+        'timestamp': time.time()
+    }
+    
+    emit('draw_data', drawing_data, room=room_id, include_self=False)
 
 @socketio.on('draw_end')
-def handle_draw_end(data):
+@_require_drawer
+def handle_draw_end(data, user_id, room_id, room_data, user_data):
     """Handle end of a drawing stroke"""
-    try:
-        # Try to get user_id from authenticated sockets store first, then fallback to session
-        authenticated_user = authenticated_sockets.get(request.sid)
-        user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
-        
-        if not user_id:
-            emit('error', {'message': 'Authentication required'})
-            return
-        
-        user_data = memory_service.get_user_session(user_id)
-        if not user_data or not user_data.get('current_room'):
-            emit('error', {'message': 'Not in a room'})
-            return
-        
-        room_id = user_data['current_room']
-        room_data = memory_service.get_room(room_id)
-        
-        if not room_data:
-            emit('error', {'message': 'Room not found'})
-            return
-        
-        # Check if user is allowed to draw
-        current_drawer = room_data['game_state'].get('current_drawer')
-        if current_drawer and current_drawer != user_id:
-            emit('error', {'message': 'Not your turn to draw'})
-            return
-        
-        # Broadcast drawing end to all players in room except sender
-        drawing_data = {
-            'type': 'end',
-            'timestamp': time.time()
-        }
-        
-        emit('draw_data', drawing_data, room=room_id, include_self=False)
-        
-    except Exception as e:
-        print(f"❌ Error in draw_end: {e}")
-        emit('error', {'message': str(e)})
+    active_strokes.pop(request.sid, None)
+    
+    if not room_has_members(room_id, skip_sid=request.sid):
+        return
+    
+    if _flusher is not None:
+        _flush_room(room_id)
+    
+    # Broadcast drawing end to all players in room except sender
+    drawing_data = {
+        'type': 'end',
+        'timestamp': time.time()
+    }
+    
+    emit('draw_data', drawing_data, room=room_id, include_self=False)
 
 @socketio.on('clear_canvas')
-def handle_clear_canvas(data):
+@_require_room
+def handle_clear_canvas(data, user_id, room_id, room_data, user_data):
     """Handle canvas clearing"""
-    try:
-        # Try to get user_id from authenticated sockets store first, then fallback to session
-        authenticated_user = authenticated_sockets.get(request.sid)
-        user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
-        
-        if not user_id:
-            emit('error', {'message': 'Authentication required'})
-            return
-        
-        user_data = memory_service.get_user_session(user_id)
-        if not user_data or not user_data.get('current_room'):
-            emit('error', {'message': 'Not in a room'})
-            return
-        
-        room_id = user_data['current_room']
-        room_data = memory_service.get_room(room_id)
-        
-        if not room_data:
-            emit('error', {'message': 'Room not found'})
-            return
-        
-        # Check if user is allowed to clear (current drawer or host)
-        current_drawer = room_data['game_state'].get('current_drawer')
-        is_host = room_data['host'] == user_id
-        
-        if not (current_drawer == user_id or is_host):
-            emit('error', {'message': 'Not authorized to clear canvas'})
-            return
-        
-        print(f"🎨 Broadcasting canvas_cleared")
-        # Broadcast canvas clear to all players in room
-        emit('canvas_cleared', {
-            'timestamp': time.time(),
-            'cleared_by': user_data['username']
-        }, room=room_id)
-        
-    except Exception as e:
-        print(f"❌ Error in clear_canvas: {e}")
-        emit('error', {'message': str(e)})
+    # Check if user is allowed to clear (current drawer or host)
+    current_drawer = room_data['current_drawer']
+    is_host = room_data['host'] == user_id
+    
+    if not (current_drawer == user_id or is_host):
+        emit('error', {'message': 'Not authorized to clear canvas'})
+        return
+    
+    logger.debug("🎨 Broadcasting canvas_cleared")
+    # Broadcast canvas clear to all players in room
+    emit('canvas_cleared', {
+        'timestamp': time.time(),
+        'cleared_by': user_data['username']
+    }, room=room_id)
 
 @socketio.on('change_tool')
-def handle_change_tool(data):
+@_require_drawer
+def handle_change_tool(data, user_id, room_id, room_data, user_data):
     """Handle drawing tool change"""
-    try:
-        user_id = session.get('user_id')
-        if not user_id:
-            emit('error', {'message': 'Authentication required'})
-            return
-        
-        user_data = memory_service.get_user_session(user_id)
-        if not user_data or not user_data.get('current_room'):
-            emit('error', {'message': 'Not in a room'})
-            return
-        
-        room_id = user_data['current_room']
-        room_data = memory_service.get_room(room_id)
-        
-        if not room_data:
-            emit('error', {'message': 'Room not found'})
-            return
-        
-        # Check if user is current drawer
-        current_drawer = room_data['game_state'].get('current_drawer')
-        if current_drawer != user_id:
-            emit('error', {'message': 'Not your turn to draw'})
-            return
-        
-        tool = data.get('tool')
-        color = data.get('color')
-        size = data.get('size')
-        
-        # Validate tool data
-        if tool and tool not in ['brush', 'eraser']:
-            emit('error', {'message': 'Invalid tool'})
-            return
-        
-        if size and (not isinstance(size, (int, float)) or size < 1 or size > 50):
-            emit('error', {'message': 'Invalid size'})
-            return
-        
-        # Broadcast tool change to other players for UI updates
-        tool_data = {
-            'tool': tool,
-            'color': color,
-            'size': size,
-            'user': user_data['username']
-        }
-        
-        emit('tool_changed', tool_data, room=room_id, include_self=False)
-        
-    except Exception as e:
-        emit('error', {'message': str(e)})
-        if not user_id:
-            emit('error', {'message': 'Authentication required'})
-            return
-        
-        user_data = memory_service.get_user_session(user_id)
-        if not user_data or not user_data.get('current_room'):
-            emit('error', {'message': 'Not in a room'})
-            return
-        
-        room_id = user_data['current_room']
-        room_data = memory_service.get_room(room_id)
-        
-        if not room_data:
-            emit('error', {'message': 'Room not found'})
-            return
-        
-        # Check if user is current drawer
-        current_drawer = room_data['game_state'].get('current_drawer')
-        if current_drawer != user_id:
-            emit('error', {'message': 'Not your turn to draw'})
-            return
-        
-        tool = data.get('tool')
-        color = data.get('color')
-        size = data.get('size')
-        
-        # Validate tool data
-        if tool and tool not in ['brush', 'eraser']:
-            emit('error', {'message': 'Invalid tool'})
-            return
-        
-        if size and (not isinstance(size, (int, float)) or size < 1 or size > 50):
-            emit('error', {'message': 'Invalid size'})
-            return
-        
-        # Broadcast tool change to other players for UI updates
-        tool_data = {
-            'tool': tool,
-            'color': color,
-            'size': size,
-            'user': user_data['username']
-        }
-        
-        emit('tool_changed', tool_data, room=room_id, include_self=False)
-        
-    except Exception as e:
-        emit('error', {'message': str(e)}) 
\ No newline at end of file
+    tool = data.get('tool')
+    color = data.get('color')
+    size = data.get('size')
+    
+    # Validate tool data
+    if tool and tool not in _VALID_TOOLS:
+        emit('error', {'message': 'Invalid tool'})
+        return
+    
+    if size and (type(size) not in _NUMBER_TYPES or size < 1 or size > 50):
+        emit('error', {'message': 'Invalid size'})
+        return
+    
+    if not room_has_members(room_id, skip_sid=request.sid):
+        return
+    
+    # Broadcast tool change to other players for UI updates
+    tool_data = {
+        'tool': tool,
+        'color': color,
+        'size': size,
+        'user': user_data['username']
+    }
+    
+    emit('tool_changed', tool_data, room=room_id, include_self=False)
+
+# Fused 'draw' event: [op, *args] with positional args in this order per opcode
+_OP_START, _OP_MOVE, _OP_END, _OP_CLEAR, _OP_TOOL = range(5)
+_OP_HANDLERS = (
+    (handle_draw_start, ('x', 'y', 'color', 'size', 'tool')),
+    (handle_draw_move, ('x', 'y')),
+    (handle_draw_end, ()),
+    (handle_clear_canvas, ()),
+    (handle_change_tool, ('tool', 'color', 'size')),
+)
+
+@socketio.on('draw')
+def handle_draw(data):
+    """Handle any drawing action sent as a compact [op, *args] array"""
+    if type(data) is not list or not data or type(data[0]) is not int or not 0 <= data[0] < len(_OP_HANDLERS):
+        return
+    
+    # Omitted trailing args fall back to the per-event defaults
+    handler, fields = _OP_HANDLERS[data[0]]
+    return handler(dict(zip(fields, data[1:])))
@@ -1,29 +1,88 @@
-from flask import session, request
+import logging
+import threading
+from flask import session, request, current_app
 from flask_socketio import emit, join_room, leave_room, disconnect
+from socketio import PubSubManager
 from app import socketio
 from app.services.memory_service import memory_service
-from datetime import datetime
+from app.utils.timestamps import iso_now
+
+logger = logging.getLogger(__name__)
 
 # In-memory store for authenticated socket connections
 authenticated_sockets = {}
+# Reverse index: user_id -> socket id of that user's latest authenticated socket
+user_sockets = {}
+# Serializes writers of the two maps above - single get/pop calls are atomic and need no lock
+_sockets_lock = threading.Lock()
+# draw_move token buckets: socket id -> (tokens, last refill monotonic_ns)
+draw_rate_buckets = {}
+# Strokes in progress: socket id -> (user_id, room_id, room_data, user_data) resolved at draw_start
+active_strokes = {}
+# Malformed draw_move packets dropped per socket id
+invalid_draw_counts = {}
+# Rooms with a debounced room_updated snapshot waiting to be sent
+_pending_snapshots = set()
+_snapshots_lock = threading.Lock()
+
+def room_has_members(room_id, skip_sid=None):
+    """False when no socket other than skip_sid is in the room, so a broadcast to it can be skipped before encoding"""
+    manager = socketio.server.manager
+    if isinstance(manager, PubSubManager):
+        return True  # members may be connected to other workers
+    members = manager.rooms.get('/', {}).get(room_id)
+    if not members:
+        return False
+    return skip_sid is None or len(members) > 1 or skip_sid not in members
+
+def drop_room_strokes(room_id):
+    """Forget strokes in progress in a room - called whenever its drawer changes"""
+    for sid, stroke in tuple(active_strokes.items()):
+        if stroke[1] == room_id:
+            active_strokes.pop(sid, None)
+
+def schedule_snapshot(room_id, delay):
+    """Coalesce the room_updated broadcasts of a join/leave burst into one per delay window"""
+    with _snapshots_lock:
+        if room_id in _pending_snapshots:
+            return
+        _pending_snapshots.add(room_id)
+    socketio.start_background_task(_send_snapshot, room_id, delay)
+
+def _send_snapshot(room_id, delay):
+    """Send the room's latest state once its debounce window closes"""
+    socketio.sleep(delay)
+    # Cleared before reading the room so a change made from here on schedules a fresh snapshot
+    with _snapshots_lock:
+        _pending_snapshots.discard(room_id)
+    try:
+        room = memory_service.get_room_with_player_details(room_id)
+        if room and room_has_members(room_id):
+            socketio.emit('room_updated', {'room': room}, room=room_id)
+    except Exception as e:
+        logger.error("❌ Error sending room snapshot for %s: %s", room_id, e)
+
+@socketio.on_error_default
+def handle_socket_error(e):
+    """Report an unexpected handler failure to the sender"""
+    # Details stay in the log - exception text can leak internals to clients
+    logger.error("❌ Error in %s: %s", request.event['message'], e, exc_info=True)
+    emit('error', {'message': 'Internal error'})
 
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
-    import logging
-    logger = logging.getLogger(__name__)
     
-    user_id = session.get('user_id')
-    logger.info(f"=== SOCKET CONNECT ===")
-    logger.info(f"Session data: {dict(session)}")
-    logger.info(f"User ID from session: {user_id}")
+    user_id = session.get('user_id') or request.cookies.get('skribly_session_id')
+    logger.debug("=== SOCKET CONNECT ===")
+    logger.debug("User ID from session: %s", user_id)
     
     if user_id:
         user_data = memory_service.get_user_session(user_id)
-        logger.info(f"User data: {user_data}")
+        logger.debug("User data: %s", user_data)
         
         if user_data:
-            logger.info(f"🔗 Socket.IO Client connected: {user_data['username']} ({user_id})")
+            logger.info("🔗 Socket.IO Client connected: %s (%s)", user_data['username'], user_id)
             # Send connection confirmation with user info
             emit('connection_confirmed', {
                 'message': 'Successfully connected to server via Socket.IO',
@@ -32,14 +91,14 @@ def handle_connect():
                 'status': 'connected'
             })
         else:
-            logger.warning(f"🔗 Socket.IO Client connected but no user data found for ID: {user_id}")
+            logger.warning("🔗 Socket.IO Client connected but no user data found for ID: %s", user_id)
             emit('connection_confirmed', {
                 'message': 'Connected but session invalid',
                 'user_id': user_id,
                 'status': 'connected_no_session'
             })
     else:
-        logger.warning(f"🔗 Socket.IO Client connected but no user ID in session")
+        logger.warning("🔗 Socket.IO Client connected but no user ID in session")
         emit('connection_confirmed', {
             'message': 'Connected but not authenticated',
             'status': 'connected_anonymous'
@@ -48,15 +107,21 @@ def handle_connect():
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"=== SOCKET DISCONNECT ===")
-    logger.info(f"Socket ID: {request.sid}")
+    sid = request.sid  # one context-local lookup instead of one per use
+    logger.debug("=== SOCKET DISCONNECT ===")
+    logger.debug("Socket ID: %s", sid)
     
     # Clean up authenticated socket
-    authenticated_user = authenticated_sockets.pop(request.sid, None)
+    with _sockets_lock:
+        authenticated_user = authenticated_sockets.pop(sid, None)
+        # Only drop the index entry if a newer socket hasn't replaced it
+        if authenticated_user and user_sockets.get(authenticated_user['user_id']) == sid:
+            del user_sockets[authenticated_user['user_id']]
+    draw_rate_buckets.pop(sid, None)
+    active_strokes.pop(sid, None)
+    invalid_draw_counts.pop(sid, None)
     if authenticated_user:
-        logger.info(f"Cleaned up authenticated socket for user: {authenticated_user['username']}")
+        logger.debug("Cleaned up authenticated socket for user: %s", authenticated_user['username'])
     
     user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
     if user_id:
@@ -66,29 +131,30 @@ def handle_disconnect():
         # They will automatically rejoin their room when the socket reconnects and emits the join_room event.
         if user_data and user_data.get('current_room'):
             room_id = user_data['current_room']
-            logger.info(f"User {user_id} temporarily disconnected from room {room_id}, preserving room membership")
+            logger.info("User %s temporarily disconnected from room %s, preserving room membership", user_id, room_id)
             # We simply emit a player_disconnected event so others can show offline status if desired.
-            emit('player_disconnected', {
-                'player_id': user_id,
-                'username': user_data.get('username', 'Unknown')
-            }, room=room_id)
-        logger.info(f"Client disconnected: {user_id}")
+            # The closing socket is still in the room here, so it doesn't count as an audience.
+            if room_has_members(room_id, skip_sid=sid):
+                emit('player_disconnected', {
+                    'player_id': user_id,
+                    'username': user_data.get('username', 'Unknown')
+                }, room=room_id)
+        logger.info("Client disconnected: %s", user_id)
     else:
         logger.info("Anonymous client disconnected")
 
 @socketio.on('authenticate')
 def handle_authenticate(data):
     """Handle socket authentication with session ID"""
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"=== SOCKET AUTHENTICATE ===")
-    logger.info(f"Data: {data}")
-    logger.info(f"Socket ID: {request.sid}")
+    sid = request.sid  # one context-local lookup instead of one per use
+    logger.debug("=== SOCKET AUTHENTICATE ===")
+    logger.debug("Data: %s", data)
+    logger.debug("Socket ID: %s", sid)
     
     try:
-        # Try to get user_id from the data or session
-        user_id = data.get('user_id') or session.get('user_id')
-        logger.info(f"User ID: {user_id}")
+        # Try to get user_id from the data, the session id cookie or the session
+        user_id = data.get('user_id') or request.cookies.get('skribly_session_id') or session.get('user_id')
+        logger.debug("User ID: %s", user_id)
         
         if not user_id:
             logger.warning("No user ID provided")
@@ -96,37 +162,37 @@ def handle_authenticate(data):
             return
         
         user_data = memory_service.get_user_session(user_id)
-        logger.info(f"User data: {user_data}")
+        logger.debug("User data: %s", user_data)
         
         if not user_data:
-            logger.warning(f"No user data found for ID: {user_id}")
+            logger.warning("No user data found for ID: %s", user_id)
             # Try to get username from session as fallback
             username = session.get('username')
             if username:
-                logger.info(f"Creating new user session for {username} with ID {user_id}")
-                # Recreate user session from available session data
-                user_data = {
+                logger.info("Creating new user session for %s with ID %s", username, user_id)
+                # Recreate user session from available session data - a concurrent re-auth
+                # for the same ID may get there first, in which case its session is kept
+                user_data, _ = memory_service.get_or_create_user_session(user_id, lambda: {
                     'session_id': user_id,
                     'username': username,
                     'avatar_url': None,
-                    'created_at': datetime.utcnow().isoformat(),
+                    'created_at': iso_now(),
                     'current_room': None
-                }
-                memory_service.add_user_session(user_id, user_data)
+                })
             else:
                 emit('authentication_failed', {'message': 'Invalid user session - please refresh page'})
                 return
         
         # Store authenticated user in socket store keyed by socket ID
-        authenticated_sockets[request.sid] = {
-            'user_id': user_id,
-            'username': user_data['username'],
-            'authenticated_at': user_data.get('created_at')
-        }
+        with _sockets_lock:
+            authenticated_sockets[sid] = {
+                'user_id': user_id,
+                'username': user_data['username'],
+                'authenticated_at': user_data.get('created_at')
+            }
+            user_sockets[user_id] = sid
         
-        # Also update session as fallback
-        session['user_id'] = user_id
-        logger.info(f"Socket authenticated for user: {user_data['username']} (socket: {request.sid})")
+        logger.info("Socket authenticated for user: %s (socket: %s)", user_data['username'], sid)
         
         emit('authentication_success', {
             'message': 'Socket authenticated successfully',
@@ -134,161 +200,169 @@ def handle_authenticate(data):
         })
         
     except Exception as e:
-        logger.error(f"❌ Socket authentication error: {str(e)}", exc_info=True)
+        logger.error("❌ Socket authentication error: %s", e, exc_info=True)
         emit('authentication_failed', {'message': str(e)})
 
 @socketio.on('join_room')
 def handle_join_room(data):
     """Handle joining a room via socket"""
-    import logging
-    logger = logging.getLogger(__name__)
-    logger.info(f"=== SOCKET JOIN ROOM REQUEST ===")
-    logger.info(f"Data: {data}")
-    logger.info(f"Socket ID: {request.sid}")
+    logger.debug("=== SOCKET JOIN ROOM REQUEST ===")
+    logger.debug("Data: %s", data)
+    logger.debug("Socket ID: %s", request.sid)
     
-    try:
-        # Try to get user_id from authenticated sockets store first, then fallback to session
-        authenticated_user = authenticated_sockets.get(request.sid)
-        user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
-        
-        logger.info(f"Authenticated socket user: {authenticated_user}")
-        logger.info(f"User ID: {user_id}")
-        
-        if not user_id:
-            logger.warning("No user ID found - user not authenticated")
-            emit('error', {'message': 'Authentication required. Please authenticate your socket connection first.'})
-            return
-        
-        room_id = data.get('room_id')
-        logger.info(f"Room ID: {room_id}")
-        if not room_id:
-            logger.warning("No room ID provided")
-            emit('error', {'message': 'Room ID required'})
-            return
-        
-        user_data = memory_service.get_user_session(user_id)
-        logger.info(f"User data: {user_data}")
-        if not user_data:
-            logger.warning(f"No user data found for user ID {user_id}")
-            emit('error', {'message': 'Invalid session. Please authenticate your socket connection first.'})
-            return
-        
-        room_data = memory_service.get_room(room_id)
-        logger.info(f"Room data: {room_data}")
-        if not room_data:
-            logger.warning(f"Room {room_id} not found - room may have been lost on server restart")
-            emit('error', {'message': 'Room not found - please refresh page to create a new room'})
-            return
-        
-        # Check if user is actually in the room (they should have joined via HTTP first)
-        logger.info(f"Room players: {room_data['players']}")
-        logger.info(f"User {user_id} in room: {user_id in room_data['players']}")
-        if user_id not in room_data['players']:
-            logger.warning(f"User {user_id} not in room {room_id} players list")
-            emit('error', {'message': 'User not in room. Please join via HTTP first.'})
-            return
-        
-        # Join the socket room (this is idempotent - safe to call multiple times)
-        join_room(room_id)
-        logger.info(f"User {user_id} joined socket room {room_id}")
-        
-        # Update user session
-        user_data['current_room'] = room_id
-        logger.info(f"Updated user session current_room to {room_id}")
-        
-        # Get fresh room data with all players
-        fresh_room_data = memory_service.get_room_with_player_details(room_id)
-        
-        # Notify user they joined with detailed room info
-        emit('room_joined', {
-            'room': fresh_room_data,
-            'user': user_data
-        })
-        
-        # Notify other players in the room with detailed info
+    # Try to get user_id from authenticated sockets store first, then fallback to session
+    authenticated_user = authenticated_sockets.get(request.sid)
+    user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
+    
+    logger.debug("Authenticated socket user: %s", authenticated_user)
+    logger.debug("User ID: %s", user_id)
+    
+    if not user_id:
+        logger.warning("No user ID found - user not authenticated")
+        emit('error', {'message': 'Authentication required. Please authenticate your socket connection first.'})
+        return
+    
+    room_id = data.get('room_id')
+    logger.debug("Room ID: %s", room_id)
+    if not room_id:
+        logger.warning("No room ID provided")
+        emit('error', {'message': 'Room ID required'})
+        return
+    
+    user_data = memory_service.get_user_session(user_id)
+    logger.debug("User data: %s", user_data)
+    if not user_data:
+        logger.warning("No user data found for user ID %s", user_id)
+        emit('error', {'message': 'Invalid session. Please authenticate your socket connection first.'})
+        return
+    
+    room_data = memory_service.get_room(room_id)
+    logger.debug("Room data: %s", room_data)
+    if not room_data:
+        logger.warning("Room %s not found - room may have been lost on server restart", room_id)
+        emit('error', {'message': 'Room not found - please refresh page to create a new room'})
+        return
+    
+    # Check if user is actually in the room (they should have joined via HTTP first)
+    logger.debug("Room players: %s", room_data['players'].keys())
+    logger.debug("User %s in room: %s", user_id, user_id in room_data['players'])
+    if user_id not in room_data['players']:
+        logger.warning("User %s not in room %s players list", user_id, room_id)
+        emit('error', {'message': 'User not in room. Please join via HTTP first.'})
+        return
+    
+    # Join the socket room (this is idempotent - safe to call multiple times)
+    join_room(room_id)
+    logger.debug("User %s joined socket room %s", user_id, room_id)
+    
+    # Update user session
+    user_data['current_room'] = room_id
+    logger.debug("Updated user session current_room to %s", room_id)
+    
+    # Get fresh room data with all players
+    fresh_room_data = memory_service.get_room_with_player_details(room_id)
+    
+    # Notify user they joined with detailed room info
+    emit('room_joined', {
+        'room': fresh_room_data,
+        'user': user_data
+    })
+    
+    # Notify other players in the room with detailed info
+    debounce = current_app.config['ROOM_UPDATE_DEBOUNCE']
+    if debounce > 0:
+        # Delta now, full room in one room_updated for the whole burst
+        emit('player_joined', {
+            'player_id': user_id,
+            'username': user_data['username']
+        }, room=room_id, include_self=False)
+        schedule_snapshot(room_id, debounce)
+    else:
         emit('player_joined', {
             'player_id': user_id,
             'username': user_data['username'],
             'room': fresh_room_data
         }, room=room_id, include_self=False)
-        
-        logger.info(f"✅ User {user_data['username']} successfully joined room {room_id} via socket")
-        
-    except Exception as e:
-        logger.error(f"❌ Socket join_room error: {str(e)}", exc_info=True)
-        emit('error', {'message': str(e)})
+    
+    logger.info("✅ User %s successfully joined room %s via socket", user_data['username'], room_id)
 
 @socketio.on('leave_room')
 def handle_leave_room(data):
     """Handle leaving a room via socket"""
-    try:
-        user_id = session.get('user_id')
-        if not user_id:
-            emit('error', {'message': 'Authentication required'})
-            return
-        
-        room_id = data.get('room_id')
-        if not room_id:
-            emit('error', {'message': 'Room ID required'})
-            return
-        
-        user_data = memory_service.get_user_session(user_id)
-        if not user_data:
-            emit('error', {'message': 'Invalid session'})
-            return
-        
-        # Leave the socket room
-        leave_room(room_id)
-        
-        # Remove player from room
-        updated_room = memory_service.remove_player_from_room(room_id, user_id)
-        
-        # Update user session
-        user_data['current_room'] = None
-        
-        # Notify user they left
-        emit('room_left', {'success': True})
-        
-        # Notify other players in the room
-        if updated_room:
+    # Authenticated sockets store first - a plain dict lookup - then the session
+    authenticated_user = authenticated_sockets.get(request.sid)
+    user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
+    if not user_id:
+        emit('error', {'message': 'Authentication required'})
+        return
+    
+    room_id = data.get('room_id')
+    if not room_id:
+        emit('error', {'message': 'Room ID required'})
+        return
+    
+    user_data = memory_service.get_user_session(user_id)
+    if not user_data:
+        emit('error', {'message': 'Invalid session'})
+        return
+    
+    # Leave the socket room
+    leave_room(room_id)
+    
+    # Remove player from room
+    updated_room = memory_service.remove_player_from_room(room_id, user_id)
+    
+    # Update user session
+    user_data['current_room'] = None
+    
+    # Notify user they left
+    emit('room_left', {'success': True})
+    
+    # Notify other players in the room - skipped when none of them is connected
+    if updated_room and room_has_members(room_id):
+        debounce = current_app.config['ROOM_UPDATE_DEBOUNCE']
+        if debounce > 0:
+            # The host is the only other field a leave can change - clients can apply it without the snapshot
             emit('player_left', {
                 'player_id': user_id,
                 'username': user_data['username'],
-                'room': updated_room
+                'host': updated_room['host']
             }, room=room_id)
-
+            schedule_snapshot(room_id, debounce)
+        else:
+            emit('player_left', {
+                'player_id': user_id,
+                'username': user_data['username'],
+                'room': memory_service.serialize_room(updated_room)
+            }, room=room_id)
+            
             # Sync room state for all clients (public room info)
             emit('room_updated', {
                 'room': memory_service.get_room_with_player_details(room_id)
             }, room=room_id)
-        
-        print(f"User {user_data['username']} left room {room_id}")
-        
-    except Exception as e:
-        emit('error', {'message': str(e)})
+    
+    logger.info("User %s left room %s", user_data['username'], room_id)
 
 @socketio.on('get_room_info')
 def handle_get_room_info(data):
     """Get current room information"""
-    try:
-        user_id = session.get('user_id')
-        if not user_id:
-            emit('error', {'message': 'Authentication required'})
-            return
-        
-        room_id = data.get('room_id')
-        if not room_id:
-            emit('error', {'message': 'Room ID required'})
-            return
-        
-        room_data = memory_service.get_room_with_player_details(room_id)
-        if not room_data:
-            emit('error', {'message': 'Room not found'})
-            return
-        
-        emit('room_info', {
-            'room': room_data
-        })
-        
-    except Exception as e:
-        emit('error', {'message': str(e)}) 
\ No newline at end of file
+    # Authenticated sockets store first - a plain dict lookup - then the session
+    authenticated_user = authenticated_sockets.get(request.sid)
+    user_id = authenticated_user['user_id'] if authenticated_user else session.get('user_id')
+    if not user_id:
+        emit('error', {'message': 'Authentication required'})
+        return
+    
+    room_id = data.get('room_id')
+    if not room_id:
+        emit('error', {'message': 'Room ID required'})
+        return
+    
+    room_data = memory_service.get_room_with_player_details(room_id)
+    if not room_data:
+        emit('error', {'message': 'Room not found'})
+        return
+    
+    emit('room_info', {
+        'room': room_data
+    })
\ No newline at end of file
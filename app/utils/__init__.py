@@ -0,0 +1 @@
+# Utils module initialization 
\ No newline at end of file
@@ -0,0 +1,15 @@
+from flask import request, session
+from app.services.memory_service import memory_service
+
+def resolve_session_id():
+    """Find the caller's session id: Flask session, session id cookie, then X-Session-ID header"""
+    # Never from the query string - URLs end up in access logs, proxies and Referer headers
+    return (session.get('user_id')
+            or request.cookies.get('skribly_session_id')
+            or request.headers.get('X-Session-ID'))
+
+def resolve_user():
+    """Resolve the caller's session id and stored user data in one pass - (user_id, user_data)"""
+    user_id = resolve_session_id()
+    user_data = memory_service.user_sessions.get(user_id) if user_id else None
+    return user_id, user_data
@@ -0,0 +1,11 @@
+import json
+from flask import Response
+
+def static_json(payload, status):
+    """Serialize a constant JSON payload once; returns a function that builds its Response"""
+    body = json.dumps(payload, separators=(',', ':')).encode()
+    
+    def respond():
+        return Response(body, status=status, mimetype='application/json')
+    
+    return respond
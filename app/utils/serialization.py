@@ -0,0 +1,65 @@
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional, fall back to stdlib json
+    orjson = None
+
+def _json_default(obj):
+    """Handle sets (game_state['players_guessed']) plus everything Flask's default provider understands"""
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    return DefaultJSONProvider.default(obj)
+
+class SetJSONProvider(DefaultJSONProvider):
+    """Stdlib Flask JSON provider that also encodes sets - used when orjson is missing"""
+    
+    default = staticmethod(_json_default)
+
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, with the stdlib provider as fallback"""
+    
+    # Non-string dict keys are coerced like json.dumps does; orjson rejects them by default
+    _options = orjson.OPT_NON_STR_KEYS if orjson else 0
+    
+    def dumps(self, obj, **kwargs):
+        """Serialize obj to a JSON string"""
+        return self._dumps_bytes(obj).decode()
+    
+    def loads(self, s, **kwargs):
+        """Deserialize a JSON string or bytes"""
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        """Build a JSON response without the intermediate str round-trip"""
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self._dumps_bytes(obj), mimetype=self.mimetype)
+    
+    def _dumps_bytes(self, obj):
+        """Serialize obj with orjson, using Flask's default() for unsupported types"""
+        return orjson.dumps(obj, default=_json_default, option=self._options)
+
+class OrjsonSocketJSON:
+    """json-module stand-in for python-socketio and python-engineio packet encoding"""
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        """Serialize obj to a JSON string - separators and other stdlib kwargs don't apply"""
+        return orjson.dumps(obj, default=_json_default, option=OrjsonProvider._options).decode()
+    
+    @staticmethod
+    def loads(s, **kwargs):
+        """Deserialize a JSON string or bytes"""
+        return orjson.loads(s)
+
+class StdlibSocketJSON:
+    """Stdlib json for python-socketio and python-engineio, with the same set handling"""
+    
+    @staticmethod
+    def dumps(obj, **kwargs):
+        """Serialize obj to a JSON string"""
+        return json.dumps(obj, default=_json_default, **kwargs)
+    
+    loads = staticmethod(json.loads)
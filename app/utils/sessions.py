@@ -0,0 +1,19 @@
+from flask.sessions import SecureCookieSessionInterface
+
+class SessionBypassInterface(SecureCookieSessionInterface):
+    """Cookie session interface that skips session loading on read-only endpoints"""
+    
+    # Endpoints that never touch the session - no cookie decode/verify, no re-sign
+    bypass_paths = frozenset({
+        '/health',
+        '/api/health',
+        '/api/game/stats',
+        '/api/rooms/list',
+    })
+    
+    def open_session(self, app, request):
+        """Return a null session for bypassed paths, otherwise load the cookie session"""
+        # Preflights are answered in before_request and never need a session
+        if request.method == 'OPTIONS' or request.path in self.bypass_paths:
+            return self.make_null_session(app)
+        return super().open_session(app, request)
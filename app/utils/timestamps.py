@@ -0,0 +1,14 @@
+import time
+
+# (epoch second, formatted string) of the last timestamp handed out
+_last = (None, None)
+
+def iso_now():
+    """Current UTC time as an ISO 8601 string (second precision), formatted once per second"""
+    global _last
+    now = int(time.time())
+    second, formatted = _last
+    if second != now:
+        formatted = time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(now))
+        _last = (now, formatted)
+    return formatted
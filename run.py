@@ -26,26 +26,55 @@ except ModuleNotFoundError:  # pragma: no cover
 # mode provided by Flask-SocketIO.  Long-polling will still work and WebSocket
 # upgrade may be limited, but the server remains fully functional.
 
-USE_EVENTLET = False
+ASYNC_MODE = None  # 'eventlet' or 'gevent' once the stdlib has been patched
+USE_WEBSOCKET = False
 
 # Import eventlet only for Python < 3.12 where it is still compatible. Importing
 # it under 3.12 can break the stdlib `ssl` module even if we catch the exception,
 # because the import process patches `ssl` in-place *before* raising.  To be safe
-# we skip the import entirely on 3.12+ and run Flask-SocketIO in its default
-# "threading" mode.
+# we skip the import entirely on 3.12+ and try gevent instead, which supports
+# 3.12 and gives the same one-greenlet-per-connection model.
 
 if sys.version_info < (3, 12):  # pragma: no cover – skip on 3.12+
     try:
         import eventlet  # noqa: F401
         eventlet.monkey_patch()  # noqa: F401
-        USE_EVENTLET = True
+        ASYNC_MODE = 'eventlet'
+        USE_WEBSOCKET = True
         print("✔ Using eventlet for async I/O ({})".format(sys.version.split()[0]))
     except Exception as _e:  # pragma: no cover – catch ALL problems
         print("⚠  Eventlet unavailable or incompatible ({}). Falling back to threading mode.".format(_e))
+else:  # pragma: no cover – 3.12+ only
+    try:
+        from gevent import monkey
+        monkey.patch_all()
+        ASYNC_MODE = 'gevent'
+        try:
+            import geventwebsocket  # noqa: F401 – WebSocket support for gevent's server
+            USE_WEBSOCKET = True
+        except ImportError:
+            pass
+        print("✔ Using gevent for async I/O ({})".format(sys.version.split()[0]))
+    except Exception as _e:  # pragma: no cover – catch ALL problems
+        print("⚠  Gevent unavailable or incompatible ({}). Falling back to threading mode.".format(_e))
+
+if ASYNC_MODE:
+    # With the stdlib patched, default to that server, with WebSocket upgrades where supported.
+    # Load .env first so values set there still take precedence over these defaults.
+    from dotenv import load_dotenv
+    load_dotenv()
+    import os
+    os.environ['_DOTENV_LOADED'] = '1'  # app.config can skip parsing .env again
+    os.environ.setdefault('SOCKETIO_ASYNC_MODE', ASYNC_MODE)
+    if USE_WEBSOCKET:
+        os.environ.setdefault('SOCKETIO_TRANSPORTS', 'polling,websocket')
+        os.environ.setdefault('SOCKETIO_ALLOW_UPGRADES', 'true')
 
 # Rest of the standard imports (after potential monkey-patching)
 import os
+import logging
 import platform
+from urllib.parse import urlsplit
 from app import create_app, socketio
 
 app = create_app()
@@ -54,13 +83,21 @@ if __name__ == '__main__':
     # Run the application
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '127.0.0.1')
-    debug = os.environ.get('FLASK_DEBUG', 'True').lower() == 'true'
+    # Opt in to debug (SETUP.md's .env does) - it turns on the reloader and per-request logging
+    debug = os.environ.get('FLASK_DEBUG', 'False').lower() == 'true'
     
     print(f"🚀 Starting Skribly server...")
     print(f"   Host: {host}")
     print(f"   Port: {port}")
     print(f"   Debug: {debug}")
     print(f"   Mode: In-Memory Only (no database)")
+    # Host and port only - a Redis URL can carry a password
+    message_queue = app.config['SOCKETIO_MESSAGE_QUEUE']
+    print(f"   Message queue: {urlsplit(message_queue).netloc.rpartition('@')[2] if message_queue else 'none (single process)'}")
     print(f"   Health check: http://{host}:{port}/health")
     
-    socketio.run(app, host=host, port=port, debug=debug) 
\ No newline at end of file
+    if not debug:
+        # Werkzeug logs every long-polling request - keep only its warnings outside debug
+        logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    
+    socketio.run(app, host=host, port=port, debug=debug, log_output=debug) 
\ No newline at end of file